@@ -0,0 +1,22 @@
+"""Simple Non-Linear Iterative Temporal Clustering (SNITC) of Satellite
+Image Time Series, with DTW and TWDTW distances.
+
+Only numpy and numba are imported with the package. rasterio, xarray,
+pandas, geopandas and dtaidistance are imported by the functions that use
+them, and the Numba kernels are cached on disk after their first
+compilation.
+"""
+from .assign import assign_clusters, assign_pixels, update_cluster
+from .connectivity import postprocessing
+from .distance import (acquisition_days, distance_fast, dtw_options,
+                       time_weight, twdtw_distances, warping_distance)
+from .export import segment_attributes, write_pandas, write_segments
+from .grid import init_cluster_hex, init_cluster_regular
+from .merge import merge_segments
+from .metrics import segment_metrics
+from .pyramid import cluster_paa, cluster_pyramid
+from .segmentation import (cluster, new_stats, normalize, pixel_major,
+                           read_pixels, recluster, snitc)
+from .tiled import snitc_tiled
+
+__version__ = "1.4"
@@ -0,0 +1,556 @@
+"""Assignment of the pixels to the clusters and update of the centres."""
+import numpy
+from numba import njit, prange
+
+from .distance import envelope, pixel_distance
+
+
+@njit(cache=True)
+def assign_pruned(img, c_series, ic, jc, rmin, rmax, cmin, cmax, S, m, kk,
+                  d, l, weight, opts, count):
+    """This function assigns the pixels of a cluster window, computing \
+    the DTW/TWDTW only for pixels that can get a smaller distance. The \
+    spatial distance, LB_Kim and LB_Keogh are checked against the current \
+    pixel distance, and the warping is abandoned once it exceeds it.
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param c_series: Average time series of cluster.
+    :type c_series: numpy.ndarray
+    :param ic: Row of cluster center.
+    :type ic: int
+    :param jc: Column of cluster center.
+    :type jc: int
+    :param rmin: Minimum row.
+    :type rmin: int
+    :param rmax: Maximum row (exclusive).
+    :type rmax: int
+    :param cmin: Minimum column.
+    :type cmin: int
+    :param cmax: Maximum column (exclusive).
+    :type cmax: int
+    :param S: Pattern spacing value.
+    :type S: int
+    :param m: Compactness value.
+    :type m: float
+    :param kk: Cluster label.
+    :type kk: int
+    :param d: Distance matrix, updated in place. Pixels with distance \
+    -inf are masked and skipped.
+    :type d: numpy.ndarray
+    :param l: Matrix label, updated in place.
+    :type l: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :param count: Number of warping distances computed and pruned, \
+    updated in place.
+    :type count: numpy.ndarray
+    """
+    bands = img.shape[2]
+
+    # Normalizing factor
+    m = m/10
+
+    lower, upper, wmin = envelope(c_series, weight, opts)
+    buf = numpy.empty((2, bands+1), d.dtype)
+
+    # Window bounds may exceed the image by one pixel
+    rmax = min(rmax, d.shape[0])
+    cmax = min(cmax, d.shape[1])
+
+    for r in range(rmin, rmax):
+        for c in range(cmin, cmax):
+            # Masked pixels are never assigned
+            if d[r, c] == -numpy.inf:
+                continue
+
+            # Calculate Spatial Distance
+            ds = (((r-ic)**2 + (c-jc)**2)**0.5)/S
+
+            D = pixel_distance(img[r, c], c_series, ds, d[r, c], m, lower,
+                               upper, wmin, weight, opts, True, buf, count)
+            if D < d[r, c]:
+                d[r, c] = D
+                l[r, c] = kk
+
+
+@njit(cache=True)
+def assign_window(img, c_series, ic, jc, rmin, rmax, cmin, cmax, S, m, kk,
+                  d, dn, ln, weight, opts, pruning, buf, count):
+    """This function computes the distance between a cluster and the \
+    pixels of its window, keeping for each pixel the smallest distance of \
+    the iteration and, on ties, the smallest cluster label. The result \
+    does not depend on the order in which clusters are processed.
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param c_series: Average time series of cluster.
+    :type c_series: numpy.ndarray
+    :param ic: Row of cluster center.
+    :type ic: int
+    :param jc: Column of cluster center.
+    :type jc: int
+    :param rmin: Minimum row.
+    :type rmin: int
+    :param rmax: Maximum row (exclusive).
+    :type rmax: int
+    :param cmin: Minimum column.
+    :type cmin: int
+    :param cmax: Maximum column (exclusive).
+    :type cmax: int
+    :param S: Pattern spacing value.
+    :type S: int
+    :param m: Compactness value.
+    :type m: float
+    :param kk: Cluster label.
+    :type kk: int
+    :param d: Distance matrix of previous iterations. Pixels with \
+    distance -inf are masked and skipped.
+    :type d: numpy.ndarray
+    :param dn: Distance matrix of this iteration, updated in place.
+    :type dn: numpy.ndarray
+    :param ln: Matrix label of this iteration, updated in place.
+    :type ln: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :param pruning: Skip pixels that cannot change label.
+    :type pruning: bool
+    :param buf: Work array with shape (2, bands+1) and the float type of d.
+    :type buf: numpy.ndarray
+    :param count: Number of warping distances computed and pruned, \
+    updated in place.
+    :type count: numpy.ndarray
+    """
+    # Normalizing factor
+    m = m/10
+
+    lower, upper, wmin = envelope(c_series, weight, opts)
+
+    # Window bounds may exceed the image by one pixel
+    rmax = min(rmax, d.shape[0])
+    cmax = min(cmax, d.shape[1])
+
+    for r in range(rmin, rmax):
+        for c in range(cmin, cmax):
+            # Masked pixels are never assigned
+            if d[r, c] == -numpy.inf:
+                continue
+
+            # Calculate Spatial Distance
+            ds = (((r-ic)**2 + (c-jc)**2)**0.5)/S
+
+            D = pixel_distance(img[r, c], c_series, ds,
+                               min(d[r, c], dn[r, c]), m, lower, upper, wmin,
+                               weight, opts, pruning, buf, count)
+            if D < dn[r, c] or (D == dn[r, c] and kk < ln[r, c]):
+                dn[r, c] = D
+                ln[r, c] = kk
+
+
+@njit(cache=True)
+def cluster_cells(C, k, bands, size, cell_rows, cell_columns):
+    """This function sorts the clusters by the cell of a grid that \
+    contains their centre, keeping the label order inside each cell.
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :param k: Number of superpixel.
+    :type k: int
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :param size: Size of the cells in pixels.
+    :type size: int
+    :param cell_rows: Number of rows of cells.
+    :type cell_rows: int
+    :param cell_columns: Number of columns of cells.
+    :type cell_columns: int
+    :returns start: Position in order of the first cluster of each cell.
+    :returns order: Cluster labels sorted by cell.
+    """
+    cell = numpy.full(k, -1)
+    start = numpy.zeros(cell_rows*cell_columns + 1, dtype=numpy.int64)
+    for kk in range(k):
+        # Skip clusters without pixels
+        if numpy.isnan(C[kk, bands]) or numpy.isnan(C[kk, bands+1]):
+            continue
+        cr = int(numpy.floor(C[kk, bands]))//size
+        cc = int(numpy.floor(C[kk, bands+1]))//size
+        cell[kk] = cr*cell_columns + cc
+        start[cell[kk]+1] += 1
+    start = numpy.cumsum(start)
+
+    order = numpy.empty(start[-1], dtype=numpy.int64)
+    fill = start[:-1].copy()
+    for kk in range(k):
+        if cell[kk] >= 0:
+            order[fill[cell[kk]]] = kk
+            fill[cell[kk]] += 1
+
+    return start, order
+
+
+@njit(parallel=True, cache=True)
+def assign_clusters(img, C, S, m, k, d, l, weight, opts, pruning, active):
+    """This function assigns the pixels to the clusters using all cores. \
+    Clusters are grouped in cells of 2S+2 pixels, and cells are colored \
+    so that windows of clusters with the same color never overlap. Each \
+    color is processed in parallel, and the result is the same as \
+    processing the clusters one after another.
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :param S: Pattern spacing value.
+    :type S: int
+    :param m: Compactness value.
+    :type m: float
+    :param k: Number of superpixel.
+    :type k: int
+    :param d: Distance matrix, updated in place. Pixels with distance \
+    -inf are masked and skipped.
+    :type d: numpy.ndarray
+    :param l: Matrix label, updated in place.
+    :type l: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :param pruning: Skip pixels that cannot change label.
+    :type pruning: bool
+    :param active: Clusters to be assigned.
+    :type active: numpy.ndarray
+    :returns count: Number of warping distances computed and pruned for \
+    each cluster.
+    """
+    rows, columns, bands = img.shape
+
+    # Grid of cells wider than a window
+    size = 2*S + 2
+    cell_rows = rows//size + 1
+    cell_columns = columns//size + 1
+    start, order = cluster_cells(C, k, bands, size, cell_rows, cell_columns)
+
+    # Best distance and label of this iteration
+    dn = numpy.full((rows, columns), numpy.inf, d.dtype)
+    ln = numpy.full((rows, columns), -1, l.dtype)
+
+    # Warping distances computed and pruned, one counter per cluster
+    count = numpy.zeros((k, 2), dtype=numpy.int64)
+
+    for color in range(4):
+        r0 = color//2
+        c0 = color % 2
+        n_rows = (cell_rows - r0 + 1)//2
+        n_columns = (cell_columns - c0 + 1)//2
+
+        for t in prange(n_rows*n_columns):
+            cr = r0 + 2*(t//n_columns)
+            cc = c0 + 2*(t % n_columns)
+            idx = cr*cell_columns + cc
+
+            buf = numpy.empty((2, bands+1), d.dtype)
+            for i in range(start[idx], start[idx+1]):
+                kk = order[i]
+                if not active[kk]:
+                    continue
+
+                # Get subimage around cluster
+                rmin = int(numpy.floor(max(C[kk, bands]-S, 0)))
+                rmax = int(numpy.floor(min(C[kk, bands]+S, rows))+1)
+                cmin = int(numpy.floor(max(C[kk, bands+1]-S, 0)))
+                cmax = int(numpy.floor(min(C[kk, bands+1]+S, columns))+1)
+                ic = int(numpy.floor(C[kk, bands]))
+                jc = int(numpy.floor(C[kk, bands+1]))
+
+                assign_window(img, C[kk, :bands], ic, jc, rmin, rmax,
+                              cmin, cmax, S, m, kk, d, dn, ln, weight, opts,
+                              pruning, buf, count[kk])
+
+    # Keep the new cluster only where it is closer than previous iterations
+    for r in prange(rows):
+        for c in range(columns):
+            if dn[r, c] < d[r, c]:
+                d[r, c] = dn[r, c]
+                l[r, c] = ln[r, c]
+
+    return count
+
+
+@njit(parallel=True, cache=True)
+def assign_pixels(img, C, S, m, k, d, l, weight, opts, pruning, active):
+    """This function assigns the pixels to the clusters in a single sweep \
+    over the image. Each pixel is compared only to the clusters whose \
+    window covers it, found from a grid of cells of S pixels, starting \
+    with its current cluster. Rows are processed in parallel, and the \
+    result is the same as processing the clusters one after another.
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :param S: Pattern spacing value.
+    :type S: int
+    :param m: Compactness value.
+    :type m: float
+    :param k: Number of superpixel.
+    :type k: int
+    :param d: Distance matrix, updated in place. Pixels with distance \
+    -inf are masked and skipped.
+    :type d: numpy.ndarray
+    :param l: Matrix label, updated in place.
+    :type l: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :param pruning: Skip clusters that cannot change the label.
+    :type pruning: bool
+    :param active: Clusters to be assigned.
+    :type active: numpy.ndarray
+    :returns count: Number of warping distances computed and pruned in \
+    each row.
+    """
+    rows, columns, bands = img.shape
+
+    # Normalizing factor
+    mn = m/10
+
+    # Grid of cells, a window covers at most 3x3 cells
+    size = max(S, 1)
+    cell_rows = rows//size + 1
+    cell_columns = columns//size + 1
+    start, order = cluster_cells(C, k, bands, size, cell_rows, cell_columns)
+
+    # Window, centre and envelope of each cluster
+    window = numpy.zeros((k, 6), dtype=numpy.int64)
+    lower = numpy.empty((k, bands), C.dtype)
+    upper = numpy.empty((k, bands), C.dtype)
+    wmin = numpy.empty((k, bands), C.dtype)
+    for kk in prange(k):
+        # Inactive clusters never cover a pixel
+        if not active[kk]:
+            continue
+        if numpy.isnan(C[kk, bands]) or numpy.isnan(C[kk, bands+1]):
+            continue
+        window[kk, 0] = int(numpy.floor(max(C[kk, bands]-S, 0)))
+        window[kk, 1] = min(int(numpy.floor(min(C[kk, bands]+S, rows))+1),
+                            rows)
+        window[kk, 2] = int(numpy.floor(max(C[kk, bands+1]-S, 0)))
+        window[kk, 3] = min(int(numpy.floor(min(C[kk, bands+1]+S,
+                                                columns))+1), columns)
+        window[kk, 4] = int(numpy.floor(C[kk, bands]))
+        window[kk, 5] = int(numpy.floor(C[kk, bands+1]))
+        lower[kk], upper[kk], wmin[kk] = envelope(C[kk, :bands],
+                                                  weight, opts)
+
+    # Warping distances computed and pruned, one counter per row so that
+    # threads never write to the same counter
+    count = numpy.zeros((rows, 2), dtype=numpy.int64)
+
+    for r in prange(rows):
+        buf = numpy.empty((2, bands+1), d.dtype)
+        cr = r//size
+        for c in range(columns):
+            # Masked pixels are never assigned
+            if d[r, c] == -numpy.inf:
+                continue
+
+            cc = c//size
+            x = img[r, c]
+            current = int(l[r, c])
+            best = numpy.inf
+            best_k = -1
+
+            # Current cluster first, it gives the tightest bound
+            for t in range(-1, 9):
+                if t < 0:
+                    if current < 0:
+                        continue
+                    first = current
+                    last = current + 1
+                else:
+                    ncr = cr + t//3 - 1
+                    ncc = cc + t % 3 - 1
+                    if (ncr < 0 or ncr >= cell_rows or ncc < 0
+                            or ncc >= cell_columns):
+                        continue
+                    idx = ncr*cell_columns + ncc
+                    first = start[idx]
+                    last = start[idx+1]
+
+                for i in range(first, last):
+                    if t < 0:
+                        kk = current
+                    else:
+                        kk = order[i]
+                        if kk == current:
+                            continue
+
+                    # Check if the window of the cluster covers the pixel
+                    if (r < window[kk, 0] or r >= window[kk, 1]
+                            or c < window[kk, 2] or c >= window[kk, 3]):
+                        continue
+
+                    # Calculate Spatial Distance
+                    ds = (((r-window[kk, 4])**2 +
+                           (c-window[kk, 5])**2)**0.5)/S
+
+                    D = pixel_distance(x, C[kk, :bands], ds,
+                                       min(d[r, c], best), mn, lower[kk],
+                                       upper[kk], wmin[kk], weight, opts,
+                                       pruning, buf, count[r])
+                    if D < best or (D == best and kk < best_k):
+                        best = D
+                        best_k = kk
+
+            # Keep the new cluster only where it is closer than previous
+            # iterations
+            if best < d[r, c]:
+                d[r, c] = best
+                l[r, c] = best_k
+
+    return count
+
+
+@njit(parallel=True, cache=True)
+def label_distances(img, C, S, m, l, weight, opts):
+    """This function computes the distance between each pixel and the \
+    cluster of its label, as the assignment engines do.
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :param S: Pattern spacing value.
+    :type S: int
+    :param m: Compactness value.
+    :type m: float
+    :param l: Matrix label. Pixels with label -2 are masked.
+    :type l: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :returns d: Distance matrix with the float type of img, infinity for \
+    unlabelled pixels and -inf for masked pixels.
+    """
+    rows, columns, bands = img.shape
+
+    # Normalizing factor
+    mn = m/10
+
+    d = numpy.full((rows, columns), numpy.inf, img.dtype)
+    count = numpy.zeros((rows, 2), dtype=numpy.int64)
+
+    for r in prange(rows):
+        buf = numpy.empty((2, bands+1), img.dtype)
+        for c in range(columns):
+            kk = int(l[r, c])
+            if kk == -2:
+                d[r, c] = -numpy.inf
+                continue
+            if kk < 0 or numpy.isnan(C[kk, bands]):
+                continue
+
+            # Calculate Spatial Distance
+            ds = (((r-int(numpy.floor(C[kk, bands])))**2 +
+                   (c-int(numpy.floor(C[kk, bands+1])))**2)**0.5)/S
+
+            c_series = C[kk, :bands]
+            d[r, c] = pixel_distance(img[r, c], c_series, ds, numpy.inf, mn,
+                                     c_series, c_series, c_series, weight,
+                                     opts, False, buf, count[r])
+
+    return d
+
+
+@njit(cache=True)
+def label_index(la, k):
+    """This function sorts the pixels by label with a counting sort, \
+    keeping the row order inside each label. Pixels with labels outside \
+    0..k-1 are ignored.
+    :param la: Matrix label.
+    :type la: numpy.ndarray
+    :param k: Number of labels.
+    :type k: int
+    :returns start: Position in index of the first pixel of each label.
+    :returns index: Flat position (row*columns + column) of the pixels \
+    sorted by label.
+    """
+    rows, columns = la.shape
+
+    # Count pixels of each label
+    start = numpy.zeros(k+1, dtype=numpy.int64)
+    for r in range(rows):
+        for c in range(columns):
+            kk = int(la[r, c])
+            if kk >= 0 and kk < k:
+                start[kk+1] += 1
+    start = numpy.cumsum(start)
+
+    index = numpy.empty(start[k], dtype=numpy.int64)
+    fill = start[:k].copy()
+    for r in range(rows):
+        for c in range(columns):
+            kk = int(la[r, c])
+            if kk >= 0 and kk < k:
+                index[fill[kk]] = r*columns + c
+                fill[kk] += 1
+
+    return start, index
+
+
+@njit(parallel=True, cache=True)
+def update_cluster(img, la, rows, columns, bands, k, C):
+    """This function update clusters. Pixels are sorted by label and each \
+    cluster sums its own pixels in row order, so there are no concurrent \
+    writes and the result does not depend on the number of threads.
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param la: Matrix label.
+    :type la: numpy.ndarray
+    :param rows: Number of rows of image.
+    :type rows: int
+    :param columns: Number of columns of image.
+    :type columns: int
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :param k: Number of superpixel.
+    :type k: int
+    :param C: ND-array containing current cluster centres information, \
+    kept for clusters without pixels.
+    :type C: numpy.ndarray
+    :returns C_new: ND-array containing updated cluster centres information.
+    """
+    c_shape = (k, bands+3)
+
+    # Sort pixels by label
+    start, index = label_index(la, k)
+
+    # Allocate array info for centres
+    C_new = numpy.zeros(c_shape, C.dtype)
+
+    # Update cluster centres with mean values
+    for kk in prange(k):
+        n = start[kk+1] - start[kk]
+
+        # Keep the centre of clusters without pixels
+        if n == 0:
+            C_new[kk, :] = C[kk, :]
+            continue
+
+        # Sums in double precision, also for float32 images
+        total = numpy.zeros(bands+2)
+        for i in range(start[kk], start[kk+1]):
+            r = index[i]//columns
+            c = index[i] % columns
+            for b in range(bands):
+                total[b] += img[r, c, b]
+            total[bands] += r
+            total[bands+1] += c
+
+        # Compute mean
+        for b in range(bands+2):
+            C_new[kk, b] = total[b]/n
+        C_new[kk, bands+2] = 1
+
+    return C_new
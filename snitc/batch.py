@@ -0,0 +1,261 @@
+"""Batch segmentation of many SITS scenes.
+
+The scenes are listed in a manifest (JSON lines), one scene per line with
+its input stack and the parameters of snitc, for example:
+
+    {"input": "tile_001.tif", "ki": 500, "m": 5}
+    {"input": "tile_002.tif", "ki": 800, "m": 5, "pruning": true}
+
+Scenes are segmented in parallel by a pool of processes that share an
+on-disk Numba compilation cache. For each scene the segments and the stats
+of the run are written to the output directory, and scenes already
+completed are skipped when the batch is run again. With "checkpoint": true
+(in a scene or in --params) an interrupted scene also resumes from its last
+iteration, at the cost of writing its label and distance matrices to disk
+after every iteration:
+
+    snitc batch manifest.jsonl output --workers 8 \
+        --params '{"distance_calculation": "twdtw", "weight_twdtw": "logistic"}'
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+
+def read_manifest(path):
+    """This function reads the scenes of a manifest.
+    :param path: Manifest with a JSON object per line (input, optional \
+    name and output, and parameters of snitc), or a JSON list of them.
+    :type path: string
+    :returns scenes: List with a dict per scene, with its name.
+    """
+    with open(path) as f:
+        text = f.read()
+
+    if text.lstrip().startswith("["):
+        scenes = json.loads(text)
+    else:
+        scenes = [json.loads(line) for line in text.splitlines()
+                  if line.strip()]
+
+    names = set()
+    for scene in scenes:
+        if "input" not in scene:
+            raise ValueError("Every scene of the manifest needs an input.")
+        scene.setdefault("name", os.path.splitext(
+            os.path.basename(scene["input"]))[0])
+        if scene["name"] in names:
+            raise ValueError("Duplicated scene name %s." % scene["name"])
+        names.add(scene["name"])
+
+    return scenes
+
+
+def scene_paths(scene, out_dir):
+    """This function gives the output, stats and completion marker of a \
+    scene.
+    :param scene: Scene of the manifest.
+    :type scene: dict
+    :param out_dir: Output directory.
+    :type out_dir: string
+    :returns output: Segmentation, a vector file or a GeoTIFF (.tif).
+    :returns stats: JSON file with the stats of the run.
+    :returns done: JSON file written once the scene is complete.
+    """
+    name = scene["name"]
+    output = scene.get("output", os.path.join(out_dir, name + ".gpkg"))
+
+    return (output, os.path.join(out_dir, name + ".stats.json"),
+            os.path.join(out_dir, name + ".done.json"))
+
+
+def write_json(path, data):
+    """This function writes a JSON file atomically, so that an interrupted \
+    run never leaves a partial file.
+    :param path: Output file.
+    :type path: string
+    :param data: Data to be written.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1, default=float)
+    os.replace(tmp, path)
+
+
+def init_worker(threads):
+    """This function sets the number of Numba threads of a worker, so the \
+    workers of a node do not oversubscribe the cores.
+    :param threads: Number of threads of each worker.
+    :type threads: int
+    """
+    import numba
+
+    numba.set_num_threads(max(1, min(threads,
+                                     numba.config.NUMBA_NUM_THREADS)))
+
+
+def segment_file(path, output, params):
+    """This function segments a SITS stack file with snitc.
+    :param path: SITS stack readable by rasterio.
+    :type path: string
+    :param output: Segmentation to be written, a vector file (see \
+    write_segments) or a GeoTIFF label raster (.tif).
+    :type output: string
+    :param params: Parameters of snitc. ki and m are required, \
+    distance_calculation defaults to twdtw and weight_twdtw to logistic.
+    :type params: dict
+    :returns output: Path of the segmentation.
+    :returns stats: Stats of the run, see new_stats.
+    """
+    import numpy
+    import rasterio
+
+    from .segmentation import snitc
+
+    params = dict(params)
+    ki = params.pop("ki")
+    m = params.pop("m")
+    distance_calculation = params.pop("distance_calculation", "twdtw")
+    weight_twdtw = params.pop("weight_twdtw", "logistic")
+
+    with rasterio.open(path) as dataset:
+        if output.lower().endswith((".tif", ".tiff")):
+            labelled, stats = snitc(dataset, ki, m, distance_calculation,
+                                    weight_twdtw, output="matrix",
+                                    return_stats=True, **params)
+            profile = dataset.profile.copy()
+            profile.update(driver="GTiff", count=1, dtype="int32",
+                           nodata=None)
+            with rasterio.open(output, "w", **profile) as dst:
+                dst.write(labelled.astype(numpy.int32), 1)
+        else:
+            output, stats = snitc(dataset, ki, m, distance_calculation,
+                                  weight_twdtw, dst_path=output,
+                                  return_stats=True, **params)
+
+    return output, stats
+
+
+def run_scene(scene, out_dir):
+    """This function segments one scene of the manifest, writing its \
+    segmentation, its stats and finally its completion marker.
+    :param scene: Scene of the manifest, with the parameters of snitc.
+    :type scene: dict
+    :param out_dir: Output directory.
+    :type out_dir: string
+    :returns name: Name of the scene.
+    :returns seconds: Wall time of the scene.
+    """
+    start = time.perf_counter()
+    output, stats_path, done_path = scene_paths(scene, out_dir)
+
+    params = {key: value for key, value in scene.items()
+              if key not in ("name", "input", "output")}
+    # Checkpoints write l and d after every iteration, so they are only
+    # kept when asked for (true keeps them in the output directory)
+    checkpoint = params.get("checkpoint")
+    if checkpoint is True:
+        checkpoint = os.path.join(out_dir, scene["name"] + ".checkpoint")
+    params["checkpoint"] = checkpoint or None
+    if params["checkpoint"] is not None:
+        # An interrupted scene continues from its last iteration
+        params.setdefault("resume", True)
+    output, stats = segment_file(scene["input"], output, params)
+
+    seconds = time.perf_counter() - start
+    write_json(stats_path, stats)
+    write_json(done_path, {"name": scene["name"], "input": scene["input"],
+                           "output": output, "seconds": seconds})
+    if params["checkpoint"] is not None:
+        shutil.rmtree(params["checkpoint"], ignore_errors=True)
+
+    return scene["name"], seconds
+
+
+def run_batch(manifest, out_dir, params=None, workers=None, threads=None,
+              cache_dir=None):
+    """This function segments the scenes of a manifest with a pool of \
+    processes. Scenes with a completion marker in out_dir are skipped, so \
+    an interrupted batch can be resumed by running it again.
+    :param manifest: Manifest file, see read_manifest.
+    :type manifest: string
+    :param out_dir: Output directory.
+    :type out_dir: string
+    :param params: Parameters of snitc shared by all scenes, overridden by \
+    the parameters of each scene.
+    :type params: dict
+    :param workers: Number of processes. Default is the number of cores.
+    :type workers: int
+    :param threads: Number of Numba threads of each process. Default is \
+    the number of cores divided by the number of processes.
+    :type threads: int
+    :param cache_dir: Directory of the Numba compilation cache shared by \
+    the processes. Default is out_dir/numba_cache.
+    :type cache_dir: string
+    :returns failed: Names of the scenes that failed.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    cores = os.cpu_count() or 1
+    workers = workers or cores
+    threads = threads or max(1, cores // workers)
+
+    # Workers compile the kernels once for all scenes and runs
+    cache_dir = cache_dir or os.path.join(out_dir, "numba_cache")
+    os.environ["NUMBA_CACHE_DIR"] = os.path.abspath(cache_dir)
+
+    scenes = []
+    for scene in read_manifest(manifest):
+        if os.path.exists(scene_paths(scene, out_dir)[2]):
+            logger.info("Skipping %s, already completed", scene["name"])
+            continue
+        scenes.append(dict(params or {}, **scene))
+
+    failed = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_worker,
+                             initargs=(threads,)) as pool:
+        futures = {pool.submit(run_scene, scene, out_dir): scene["name"]
+                   for scene in scenes}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                name, seconds = future.result()
+                logger.info("Completed %s in %.1f s", name, seconds)
+            except Exception:
+                logger.exception("Scene %s failed", name)
+                failed.append(name)
+
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("manifest", help="JSON lines file with the scenes")
+    parser.add_argument("out_dir", help="output directory")
+    parser.add_argument("--params", type=json.loads, default={},
+                        help="JSON object with parameters of all scenes")
+    parser.add_argument("--workers", type=int, help="number of processes")
+    parser.add_argument("--threads", type=int,
+                        help="Numba threads of each process")
+    parser.add_argument("--cache-dir", help="shared Numba cache directory")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(name)s %(message)s")
+    failed = run_batch(args.manifest, args.out_dir, params=args.params,
+                       workers=args.workers, threads=args.threads,
+                       cache_dir=args.cache_dir)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,379 @@
+"""Benchmarks of the SNITC pipeline stages on synthetic SITS.
+
+Each stage is timed separately across scene size, number of bands, number
+of superpixels and number of threads, reporting the throughput in pixels
+per second and the peak resident memory added by the stage:
+
+    snitc benchmark --size 256 512 --bands 12 23 --ki 100 400 \
+        --threads 1 4 --csv benchmark.csv
+
+With --pyramid or --paa, the whole clustering is also timed at full \
+resolution and with cluster_pyramid or cluster_paa for each factor, and \
+the segmentations are compared with the planted segments (achievable \
+segmentation accuracy) and with the full resolution result.
+"""
+import argparse
+import resource
+import sys
+import time
+
+import numba
+import numpy
+import pandas as pd
+import xarray
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from .assign import update_cluster
+from .connectivity import postprocessing
+from .distance import acquisition_days, distance_fast
+from .export import write_pandas
+from .grid import init_cluster_hex, init_cluster_regular
+from .pyramid import cluster_paa, cluster_pyramid
+from .segmentation import (cluster, new_stats, normalize, pixel_major,
+                           read_pixels)
+
+
+def synthetic_sits(rows, columns, bands, segments=64, noise=0.03, seed=0):
+    """This function creates a synthetic SITS with known segments. The \
+    scene is split in the Voronoi cells of random seeds, and every cell \
+    gets its own seasonal curve (a Gaussian peak over a base value), plus \
+    Gaussian noise. Acquisitions are 16 days apart, starting in 2019.
+    :param rows: Number of rows of image.
+    :type rows: int
+    :param columns: Number of columns of image.
+    :type columns: int
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :param segments: Number of planted segments.
+    :type segments: int
+    :param noise: Standard deviation of the noise, in NDVI units.
+    :type noise: float
+    :param seed: Seed of the random generator.
+    :type seed: int
+    :returns dataset: xarray.DataArray (time, y, x) scaled by 10000, with \
+    transform and crs attributes, as read by snitc.
+    :returns truth: Label of the planted segment of each pixel.
+    """
+    rng = numpy.random.default_rng(seed)
+
+    # Segments are the Voronoi cells of random seeds
+    centres = rng.random((segments, 2)) * [rows, columns]
+    truth = numpy.empty((rows, columns), dtype=numpy.int32)
+    cc = numpy.arange(columns)
+    for r in range(rows):
+        dist = ((r - centres[:, 0, None])**2 +
+                (cc[None, :] - centres[:, 1, None])**2)
+        truth[r] = dist.argmin(axis=0)
+
+    # Seasonal curve of each segment
+    dates = numpy.datetime64("2019-01-01") + 16*numpy.arange(bands)
+    days = 16*numpy.arange(bands)
+    base = rng.uniform(0.1, 0.3, segments)
+    amplitude = rng.uniform(0.2, 0.6, segments)
+    peak = rng.uniform(0, 16*bands, segments)
+    width = rng.uniform(30, 90, segments)
+    curves = base[:, None] + amplitude[:, None]*numpy.exp(
+        -((days[None, :] - peak[:, None])/width[:, None])**2)
+
+    img = curves[truth].transpose(2, 0, 1)
+    img = img + rng.normal(0, noise, img.shape)
+    img = numpy.clip(img, 0, 1)*10000
+
+    dataset = xarray.DataArray(img, dims=("time", "y", "x"),
+                               coords={"time": dates})
+    dataset.attrs = {"transform": from_origin(0, rows*10, 10, 10),
+                     "crs": "EPSG:32723"}
+
+    return dataset, truth
+
+
+def synthetic_raster(dataset):
+    """This function writes a synthetic SITS to an in-memory GeoTIFF, to \
+    benchmark the rasterio readers.
+    :param dataset: SITS created by synthetic_sits.
+    :type dataset: xarray.DataArray
+    :returns memfile: rasterio MemoryFile, open it with memfile.open().
+    """
+    bands, rows, columns = dataset.shape
+    memfile = MemoryFile()
+    with memfile.open(driver="GTiff", count=bands, height=rows,
+                      width=columns, dtype="float64",
+                      transform=dataset.attrs["transform"],
+                      crs=dataset.attrs["crs"]) as dst:
+        dst.write(dataset.values)
+
+    return memfile
+
+
+def resident_memory(reset=False):
+    """This function reads the peak resident memory (RSS) of the process, \
+    that also counts the arrays allocated inside Numba kernels. On Linux \
+    the peak can be reset to the current RSS (/proc/self/clear_refs), \
+    elsewhere it is the peak of the whole process (resource.getrusage).
+    :param reset: Reset the peak before reading it.
+    :type reset: bool
+    :returns rss: Peak resident memory, in MB.
+    """
+    try:
+        if reset:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])/2**10
+    except OSError:
+        pass
+
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss/2**20
+    return rss/2**10
+
+
+def measure(func, *args, repeat=3, **kwargs):
+    """This function runs a stage once to compile it, then times it.
+    :param func: Stage to be timed.
+    :type func: function
+    :param repeat: Number of timed runs, the fastest is kept.
+    :type repeat: int
+    :returns seconds: Wall time of the fastest run.
+    :returns peak: Peak resident memory added by the stage, in MB, see \
+    resident_memory. Without a reset of the peak (outside Linux), a stage \
+    that stays below the peak of the process reports 0.
+    """
+    func(*args, **kwargs)
+
+    seconds = numpy.inf
+    peak = 0.0
+    for i in range(repeat):
+        base = resident_memory(reset=True)
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        seconds = min(seconds, time.perf_counter() - start)
+        peak = max(peak, resident_memory() - base)
+
+    return seconds, peak
+
+
+def benchmark_scene(size, bands, ki, threads, m=5, repeat=3):
+    """This function times every stage of the pipeline on a synthetic \
+    scene.
+    :param size: Number of rows and columns of the scene.
+    :type size: int
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :param ki: Number of desired superpixel.
+    :type ki: int
+    :param threads: Number of Numba threads.
+    :type threads: int
+    :param m: Compactness value.
+    :type m: int
+    :param repeat: Number of timed runs of each stage.
+    :type repeat: int
+    :returns results: List with a dict per stage.
+    """
+    numba.set_num_threads(threads)
+
+    dataset, truth = synthetic_sits(size, size, bands, seed=size + bands)
+    img = normalize(pixel_major(dataset.values), 0, 10000)
+    days = acquisition_days(dataset.coords["time"].values, bands)
+    pixels = size*size
+
+    # Labels of one iteration, used by the stages after the assignment
+    C, S, l, d, k, residuals = cluster(img, ki, m, "dtw", "logistic",
+                                       iter=1)
+    labelled = postprocessing(l, S)
+
+    # Window of a cluster in the middle of the scene
+    kk = k//2
+    rmin = int(max(C[kk, bands] - S, 0))
+    rmax = int(min(C[kk, bands] + S, size)) + 1
+    cmin = int(max(C[kk, bands+1] - S, 0))
+    cmax = int(min(C[kk, bands+1] + S, size)) + 1
+    subim = img[rmin:rmax, cmin:cmax]
+    ic = int(C[kk, bands]) - rmin
+    jc = int(C[kk, bands+1]) - cmin
+
+    # GeoTIFF of the scene, read by the first stage
+    memfile = synthetic_raster(dataset)
+    raster = memfile.open()
+
+    stages = [
+        ("read_pixels", pixels, read_pixels, (raster,), {}),
+        ("init_cluster_hex", pixels, init_cluster_hex,
+         (size, size, ki, img, bands), {}),
+        ("init_cluster_regular", pixels, init_cluster_regular,
+         (size, size, ki, img, bands), {}),
+    ]
+    for dc, weight in (("dtw", "logistic"), ("twdtw", "logistic"),
+                       ("twdtw", "linear")):
+        name = "distance_fast[%s]" % dc
+        if dc == "twdtw":
+            name = "distance_fast[twdtw-%s]" % weight
+        stages.append((name, subim.shape[0]*subim.shape[1],
+                       distance_fast,
+                       (C[kk, :bands], ic, jc, subim, S, m, rmin, cmin, dc,
+                        weight), {"dates": days}))
+    stages.extend([
+        ("update_cluster", pixels, update_cluster,
+         (img, l, size, size, bands, k, C), {}),
+        ("postprocessing", pixels, postprocessing, (l, S), {}),
+        ("write_pandas", pixels, write_pandas,
+         (labelled, dataset.attrs["transform"], dataset.attrs["crs"]), {}),
+    ])
+
+    results = []
+    for name, n, func, args, kwargs in stages:
+        seconds, peak = measure(func, *args, repeat=repeat, **kwargs)
+        results.append({"stage": name, "size": size, "bands": bands,
+                         "ki": ki, "threads": threads, "pixels": n,
+                         "seconds": seconds, "pixels_per_second": n/seconds,
+                         "peak_mb": peak})
+    raster.close()
+    memfile.close()
+
+    return results
+
+
+def segmentation_accuracy(labels, truth):
+    """This function computes the achievable segmentation accuracy: the \
+    fraction of pixels that fall in the truth segment that overlaps most \
+    with their segment.
+    :param labels: Segmentation.
+    :type labels: numpy.ndarray
+    :param truth: Reference segmentation.
+    :type truth: numpy.ndarray
+    :returns accuracy: Achievable segmentation accuracy, from 0 to 1.
+    """
+    n = int(truth.max()) + 1
+    pairs, overlap = numpy.unique(labels.astype(numpy.int64).ravel()*n +
+                                  truth.ravel(), return_counts=True)
+    best = {}
+    for pair, count in zip(pairs // n, overlap):
+        best[pair] = max(best.get(pair, 0), count)
+
+    return sum(best.values())/labels.size
+
+
+def benchmark_reduced(size, bands, ki, threads, pyramid=(), paa=(), m=5,
+                      iter=10, refine=2, repeat=3):
+    """This function compares the full resolution clustering with \
+    cluster_pyramid and cluster_paa on a synthetic scene.
+    :param size: Number of rows and columns of the scene.
+    :type size: int
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :param ki: Number of desired superpixel.
+    :type ki: int
+    :param threads: Number of Numba threads.
+    :type threads: int
+    :param pyramid: Downsampling factors of cluster_pyramid.
+    :type pyramid: list
+    :param paa: Number of bands of each PAA segment of cluster_paa.
+    :type paa: list
+    :param m: Compactness value.
+    :type m: int
+    :param iter: Number of iterations (coarse iterations of the pyramid).
+    :type iter: int
+    :param refine: Number of refinement iterations of the pyramid, and of \
+    full time series iterations of PAA.
+    :type refine: int
+    :param repeat: Number of timed runs of each configuration.
+    :type repeat: int
+    :returns results: List with a dict per configuration, with the \
+    accuracy against the planted segments (asa), the accuracy against the \
+    full resolution segmentation (agreement) and the number of warping \
+    distances computed (evaluated).
+    """
+    numba.set_num_threads(threads)
+
+    dataset, truth = synthetic_sits(size, size, bands, seed=size + bands)
+    img = normalize(pixel_major(dataset.values), 0, 10000)
+    dates = dataset.coords["time"].values
+    pixels = size*size
+
+    configs = [("cluster", cluster, {"iter": iter})]
+    for factor in pyramid:
+        configs.append(("cluster_pyramid[%d]" % factor, cluster_pyramid,
+                        {"factor": factor, "iter": iter, "refine": refine}))
+    for factor in paa:
+        configs.append(("cluster_paa[%d]" % factor, cluster_paa,
+                        {"factor": factor, "iter": iter, "final": refine}))
+
+    results = []
+    reference = None
+    for name, func, kwargs in configs:
+        seconds, peak = measure(func, img, ki, m, "twdtw", "logistic",
+                                repeat=repeat, dates=dates, **kwargs)
+        stats = new_stats()
+        C, S, l, d, k, residuals = func(img, ki, m, "twdtw", "logistic",
+                                        dates=dates, stats=stats, **kwargs)
+        labelled = postprocessing(l, S)
+        if reference is None:
+            reference = labelled
+        results.append({"stage": name, "size": size, "bands": bands,
+                        "ki": ki, "threads": threads, "pixels": pixels,
+                        "seconds": seconds,
+                        "pixels_per_second": pixels/seconds,
+                        "peak_mb": peak,
+                        "evaluated": stats["distances"]["evaluated"],
+                        "asa": segmentation_accuracy(labelled, truth),
+                        "agreement": segmentation_accuracy(labelled,
+                                                           reference)})
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=int, nargs="+", default=[256, 512],
+                        help="rows and columns of the scenes")
+    parser.add_argument("--bands", type=int, nargs="+", default=[12, 23],
+                        help="number of bands")
+    parser.add_argument("--ki", type=int, nargs="+", default=[100, 400],
+                        help="number of desired superpixels")
+    parser.add_argument("--threads", type=int, nargs="+",
+                        default=[1, numba.config.NUMBA_NUM_THREADS],
+                        help="number of Numba threads")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timed runs of each stage, the fastest is kept")
+    parser.add_argument("--pyramid", type=int, nargs="+", default=[],
+                        metavar="FACTOR",
+                        help="also compare the full resolution "
+                             "clustering with cluster_pyramid at these "
+                             "factors")
+    parser.add_argument("--paa", type=int, nargs="+", default=[],
+                        metavar="FACTOR",
+                        help="also compare the full resolution "
+                             "clustering with cluster_paa at these factors")
+    parser.add_argument("--csv", help="write the results to this file")
+    args = parser.parse_args(argv)
+    args.threads = [min(t, numba.config.NUMBA_NUM_THREADS)
+                    for t in args.threads]
+
+    results = []
+    for size in args.size:
+        for bands in args.bands:
+            for ki in args.ki:
+                for threads in sorted(set(args.threads)):
+                    results.extend(benchmark_scene(size, bands, ki, threads,
+                                                   repeat=args.repeat))
+                    if args.pyramid or args.paa:
+                        results.extend(benchmark_reduced(
+                            size, bands, ki, threads, args.pyramid,
+                            args.paa, repeat=args.repeat))
+
+    df = pd.DataFrame(results)
+    with pd.option_context("display.max_rows", None, "display.width", 120):
+        print(df.to_string(index=False, float_format="%.4g"))
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+
+    return df
+
+
+if __name__ == "__main__":
+    main()
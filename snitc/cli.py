@@ -0,0 +1,92 @@
+"""Command line interface of SNITC.
+
+    snitc run stack.tif segments.gpkg --ki 500 --m 5 --pruning
+    snitc batch manifest.jsonl output --workers 8
+    snitc benchmark --size 256 --bands 23
+"""
+import argparse
+import json
+import logging
+import sys
+
+
+def run(argv=None):
+    """This function segments a single SITS stack file.
+    :param argv: Command line arguments.
+    :type argv: list
+    :returns status: Exit status.
+    """
+    from .batch import segment_file
+
+    parser = argparse.ArgumentParser(prog="snitc run",
+                                     description="Segment a SITS stack.")
+    parser.add_argument("input", help="SITS stack readable by rasterio")
+    parser.add_argument("output", help="vector file (.gpkg, .fgb, "
+                        ".parquet, .shp) or GeoTIFF label raster (.tif)")
+    parser.add_argument("--ki", type=int, required=True,
+                        help="number of desired superpixels")
+    parser.add_argument("--m", type=float, required=True,
+                        help="compactness value")
+    parser.add_argument("--distance", default="twdtw",
+                        choices=("dtw", "twdtw"),
+                        help="temporal distance (default twdtw)")
+    parser.add_argument("--weight", default="logistic",
+                        choices=("logistic", "linear"),
+                        help="TWDTW temporal weight (default logistic)")
+    parser.add_argument("--iter", type=int, default=10,
+                        help="number of iterations (default 10)")
+    parser.add_argument("--scale", type=float, default=10000,
+                        help="scale of the time series (default 10000)")
+    parser.add_argument("--engine", default="parallel",
+                        choices=("parallel", "pixel", "serial"),
+                        help="assignment engine (default parallel)")
+    parser.add_argument("--pruning", action="store_true",
+                        help="skip pixels that cannot change label")
+    parser.add_argument("--dtype", default="float64",
+                        choices=("float64", "float32"),
+                        help="precision of the image and distances")
+    parser.add_argument("--params", type=json.loads, default={},
+                        help="JSON object with other parameters of snitc")
+    parser.add_argument("--stats", help="write the stats of the run to "
+                        "this JSON file")
+    args = parser.parse_args(argv)
+
+    params = dict(ki=args.ki, m=args.m, distance_calculation=args.distance,
+                  weight_twdtw=args.weight, iter=args.iter,
+                  scale=args.scale, engine=args.engine,
+                  pruning=args.pruning, dtype=args.dtype)
+    params.update(args.params)
+
+    output, stats = segment_file(args.input, args.output, params)
+    if args.stats:
+        with open(args.stats, "w") as f:
+            json.dump(stats, f, indent=1, default=float)
+
+    return 0
+
+
+def main(argv=None):
+    """This function runs a command of the snitc CLI.
+    :param argv: Command line arguments.
+    :type argv: list
+    :returns status: Exit status.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    commands = ("run", "batch", "benchmark")
+    if not argv or argv[0] not in commands:
+        print("usage: snitc {run,batch,benchmark} ...\n\n" +
+              __doc__.split("\n\n")[1])
+        return 0 if argv and argv[0] in ("-h", "--help") else 2
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(name)s %(message)s")
+    command, argv = argv[0], argv[1:]
+    if command == "run":
+        return run(argv)
+    if command == "batch":
+        from .batch import main as batch
+        return batch(argv)
+
+    from .benchmark import main as benchmark
+    benchmark(argv)
+    return 0
@@ -0,0 +1,217 @@
+"""Connectivity enforcement of the superpixels."""
+import numpy
+from numba import njit
+
+
+def postprocessing(raster, S, max_iter=10, nodata=None):
+    """Post processing function to enforce connectivity. The connected \
+    components (4-connectivity) of each segment are labelled, and every \
+    component smaller than S²/2 pixels is merged into the adjacent \
+    component it shares the longest border with, preferring components \
+    that are not small. This is repeated until no small component can be \
+    merged. Labels are int32, or int64 for images with more than 2^31 \
+    pixels. Larger than memory rasters are processed tile by tile by \
+    snitc_tiled.
+    :param raster: Labelled image, it is not modified.
+    :type raster: numpy.ndarray
+    :param S: Spacing between superpixels.
+    :type S: int
+    :param max_iter: Maximum number of merge passes.
+    :type max_iter: int
+    :param nodata: Label of masked pixels. They are never merged nor merged \
+    into, and get -1 in the output.
+    :type nodata: int
+    :returns final: Labelled image with connectivity enforced, with \
+    consecutive labels starting at 0.
+    """
+    T = int((S**2)/2)
+
+    if raster.size < 2**31:
+        comp = numpy.empty(raster.shape, dtype=numpy.int32)
+    else:
+        comp = numpy.empty(raster.shape, dtype=numpy.int64)
+
+    n = label_components(numpy.ascontiguousarray(raster), comp)
+    masked = None if nodata is None else raster == nodata
+
+    for i in range(max_iter):
+        sizes = numpy.bincount(comp.ravel(), minlength=n)
+        small = sizes < T
+        if masked is not None:
+            # Components of masked pixels
+            fixed = numpy.zeros(n, dtype=bool)
+            fixed[comp[masked]] = True
+            small &= ~fixed
+        if not small.any():
+            break
+
+        # Borders between small components and their neighbours
+        a, b = component_borders(comp, small)
+        if masked is not None:
+            keep = ~fixed[b]
+            a = a[keep]
+            b = b[keep]
+        if len(a) == 0:
+            break
+
+        # Best neighbour of each small component: not small, then longest
+        # border, then largest, then smallest label
+        pairs, border = numpy.unique(a*n + b, return_counts=True)
+        pa = pairs//n
+        pb = pairs % n
+        order = numpy.lexsort((pb, -sizes[pb], -border, small[pb], pa))
+        first = order[numpy.r_[True, pa[order][1:] != pa[order][:-1]]]
+        target = numpy.full(n, -1, dtype=numpy.int64)
+        target[pa[first]] = pb[first]
+
+        lookup = merge_components(target).astype(comp.dtype)
+        n = label_components(lookup[comp], comp)
+
+    if masked is not None and masked.any():
+        # Masked components get -1, the others keep consecutive labels
+        fixed = numpy.zeros(n, dtype=bool)
+        fixed[comp[masked]] = True
+        lookup = (numpy.cumsum(~fixed) - 1).astype(comp.dtype)
+        lookup[fixed] = -1
+        comp = lookup[comp]
+
+    return comp
+
+
+@njit(cache=True)
+def label_components(raster, comp):
+    """This function labels the connected components (4-connectivity) of \
+    the segments in two raster scans, using comp itself as the union-find \
+    forest of the pixels.
+    :param raster: Labelled image.
+    :type raster: numpy.ndarray
+    :param comp: C-contiguous array with the shape of raster and an \
+    integer type that holds its number of pixels, overwritten with the \
+    component of each pixel, numbered in raster order.
+    :type comp: numpy.ndarray
+    :returns n: Number of components.
+    """
+    rows, columns = raster.shape
+    parent = comp.reshape(rows*columns)
+
+    # Every pixel points to a smaller pixel of its component
+    for r in range(rows):
+        for c in range(columns):
+            p = r*columns + c
+            parent[p] = p
+            if c > 0 and raster[r, c-1] == raster[r, c]:
+                link_roots(parent, p, p-1)
+            if r > 0 and raster[r-1, c] == raster[r, c]:
+                link_roots(parent, p, p-columns)
+
+    # Roots come first in raster order, so the parent of every other pixel
+    # already holds its component
+    n = 0
+    for p in range(rows*columns):
+        if parent[p] == p:
+            parent[p] = n
+            n += 1
+        else:
+            parent[p] = parent[parent[p]]
+
+    return n
+
+
+@njit(cache=True)
+def link_roots(parent, a, b):
+    """This function joins the trees of two nodes of a union-find forest, \
+    the smallest root becoming the root of both.
+    :param parent: Union-find parent of each node, updated in place.
+    :type parent: numpy.ndarray
+    :param a: Node.
+    :type a: int
+    :param b: Node.
+    :type b: int
+    """
+    while parent[a] != a:
+        parent[a] = parent[parent[a]]
+        a = parent[a]
+    while parent[b] != b:
+        parent[b] = parent[parent[b]]
+        b = parent[b]
+
+    if a < b:
+        parent[b] = a
+    elif b < a:
+        parent[a] = b
+
+
+@njit(cache=True)
+def component_borders(comp, small):
+    """This function lists the pixel borders (4-connectivity) between \
+    small components and their neighbours, once for each border pixel pair.
+    :param comp: Component of each pixel.
+    :type comp: numpy.ndarray
+    :param small: Whether each component is small.
+    :type small: numpy.ndarray
+    :returns a: Small component of each border.
+    :returns b: Neighbour component of each border.
+    """
+    rows, columns = comp.shape
+
+    # Count the borders to allocate the output once
+    n = 0
+    for r in range(rows):
+        for c in range(columns):
+            x = comp[r, c]
+            if c + 1 < columns and comp[r, c+1] != x:
+                n += small[x] + small[comp[r, c+1]]
+            if r + 1 < rows and comp[r+1, c] != x:
+                n += small[x] + small[comp[r+1, c]]
+
+    a = numpy.empty(n, dtype=numpy.int64)
+    b = numpy.empty(n, dtype=numpy.int64)
+    i = 0
+    for r in range(rows):
+        for c in range(columns):
+            x = comp[r, c]
+            for t in range(2):
+                if t == 0:
+                    if c + 1 >= columns:
+                        continue
+                    y = comp[r, c+1]
+                else:
+                    if r + 1 >= rows:
+                        continue
+                    y = comp[r+1, c]
+                if y == x:
+                    continue
+                if small[x]:
+                    a[i] = x
+                    b[i] = y
+                    i += 1
+                if small[y]:
+                    a[i] = y
+                    b[i] = x
+                    i += 1
+
+    return a, b
+
+
+@njit(cache=True)
+def merge_components(target):
+    """This function merges each component into its target component, \
+    following chains of merged components.
+    :param target: Component each component is merged into, or -1.
+    :type target: numpy.ndarray
+    :returns lookup: Representative component of each component.
+    """
+    n = target.shape[0]
+    parent = numpy.arange(n)
+    for x in range(n):
+        if target[x] >= 0:
+            link_roots(parent, x, target[x])
+
+    lookup = numpy.empty(n, dtype=numpy.int64)
+    for x in range(n):
+        a = x
+        while parent[a] != a:
+            a = parent[a]
+        lookup[x] = a
+
+    return lookup
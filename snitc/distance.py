@@ -0,0 +1,648 @@
+"""DTW and TWDTW distances, lower bounds and spatial-temporal distance."""
+import numpy
+from numba import njit, prange
+
+
+def distance_fast(c_series, ic, jc, subim, S, m, rmin, cmin, 
+                  distance_calculation, weight_twdtw,  
+                  window=None, max_dist=None, max_step=None, 
+                  max_diff=None, penalty=None, psi=None, dates=None,
+                  alpha=None, beta=None, buffer=None, variables=1,
+                  valid=None):
+    """This function computes the spatial-temporal distance between \
+    two pixels using the dtw distance with C implementation, or the \
+    twdtw distance with the Numba implementation. Multivariate series, \
+    and dtw without dtaidistance, use the Numba implementation.
+    :param c_series: average time series of cluster.
+    :type c_series: numpy.ndarray
+    :param ic: X coordinate of cluster center.
+    :type ic: int
+    :param jc: Y coordinate of cluster center.
+    :type jc: int
+    :param subim: View of the block of image from the cluster under \
+    analysis, with shape (rows, columns, bands).
+    :type subim: numpy.ndarray
+    :param S: Pattern spacing value.
+    :type S: int
+    :param m: Compactness value.
+    :type m: float
+    :param rmin: Minimum row.
+    :type rmin: int
+    :param cmin: Minimum column.
+    :type cmin: int
+    :param window: Only allow for maximal shifts from the two diagonals \
+    smaller than this number. It includes the diagonal, meaning that an \
+    Euclidean distance is obtained by setting window=1.
+    :param max_dist: Stop if the returned values will be larger than \
+    this value.
+    :param max_step: Do not allow steps larger than this value.
+    :param max_diff: Return infinity if length of two series is larger.
+    :param penalty: Penalty to add if compression or expansion is applied.
+    :param psi: Psi relaxation parameter (ignore start and end of matching).
+        Useful for cyclical series.
+    :param dates: Elapsed days of each band, used by twdtw.
+    :param alpha: Steepness or slope of the twdtw temporal weight.
+    :param beta: Midpoint or offset of the twdtw temporal weight.
+    :param buffer: Work array with at least rows*columns+1 rows, reused \
+    between calls to pass the block to dtaidistance.
+    :type buffer: numpy.ndarray
+    :param variables: Number of variables of each date, see dtw_options.
+    :type variables: int
+    :param valid: Pixels of the block that are compared, the distance of \
+    the others is infinity. Default None compares every pixel.
+    :type valid: numpy.ndarray
+    :returns D:  numpy.ndarray distance.
+    """
+    # Normalizing factor
+    m = m/10
+
+    rows, columns, bands = subim.shape
+    block = subim
+    if valid is not None:
+        # Only the valid pixels are compared, as a block of one column
+        block = subim[valid][:, None]
+
+    dc = None
+    if distance_calculation == "dtw" and variables == 1:
+        # C implementation of dtaidistance, if it is installed
+        dc = dtaidistance_distances(block, c_series, buffer, window=window,
+                                    max_dist=max_dist, max_step=max_step,
+                                    max_diff=max_diff, penalty=penalty,
+                                    psi=psi)
+
+    if dc is None and distance_calculation in ("dtw", "twdtw"):
+        # Compute twdtw distances with the temporal weight inside the
+        # warping cost (Calculate Temporal Distance), the same distances as
+        # dtaidistance for dtw
+        weight, opts = warping_options(subim, distance_calculation,
+                                       weight_twdtw, dates=dates, alpha=alpha,
+                                       beta=beta, window=window,
+                                       max_dist=max_dist, max_step=max_step,
+                                       penalty=penalty, psi=psi,
+                                       variables=variables)
+        dc = twdtw_distances(block, c_series, weight, opts)
+
+    elif dc is None:
+        raise ValueError("Choose a spatio-temporal distance calculation "
+                         "method (dtw or twdtw)")
+
+    if valid is not None:
+        full = numpy.full((rows, columns), numpy.inf, dc.dtype)
+        full[valid] = dc.ravel()
+        dc = full
+    else:
+        dc = dc.reshape(rows, columns)
+
+    x = numpy.arange(rows)
+    y = numpy.arange(columns)
+    xx, yy = numpy.meshgrid(x, y, sparse=True, indexing='ij')
+
+    # Calculate Spatial Distance
+    ds = (((xx-ic)**2 + (yy-jc)**2)**0.5)
+
+    # Calculate SPatial-temporal distance
+    D = (dc)/m+(ds/S)
+
+    return D
+
+
+def dtaidistance_distances(block, c_series, buffer=None, window=None,
+                           max_dist=None, max_step=None, max_diff=None,
+                           penalty=None, psi=None):
+    """This function computes the dtw distance between every pixel of a \
+    block and the cluster time series with the C implementation of \
+    dtaidistance.
+    :param block: Block of image, with shape (rows, columns, bands).
+    :type block: numpy.ndarray
+    :param c_series: Average time series of cluster.
+    :type c_series: numpy.ndarray
+    :param buffer: Work array with at least rows*columns+1 rows, see \
+    distance_fast.
+    :type buffer: numpy.ndarray
+    :returns dc: numpy.ndarray with the distance of each pixel, or None if \
+    dtaidistance or its C library is not installed.
+    """
+    try:
+        from dtaidistance import dtw
+        from dtaidistance.exceptions import PackageMissingException
+    except ImportError:
+        return None
+
+    # Copy block and cluster time series to the work array, to allow
+    # dtw fast computation with dtaidistance
+    n = block.shape[0]*block.shape[1]
+    if buffer is None:
+        buffer = numpy.empty((n+1, block.shape[2]))
+    merge = buffer[:n+1]
+    merge[:n].reshape(block.shape)[:] = block
+    merge[n] = c_series
+
+    # Compute dtw distances (Calculate Temporal Distance)
+    try:
+        c = dtw.distance_matrix_fast(merge, block=((0, merge.shape[0]),
+                                     (merge.shape[0] - 1, merge.shape[0])),
+                                     compact=True, parallel=True,
+                                     window=window, max_dist=max_dist,
+                                     max_step=max_step,
+                                     max_length_diff=max_diff,
+                                     penalty=penalty, psi=psi)
+    except PackageMissingException:
+        return None
+
+    return numpy.frombuffer(c)
+
+
+def acquisition_days(dates, bands):
+    """This function converts the acquisition dates of the bands to \
+    elapsed days since the first acquisition.
+    :param dates: Acquisition dates. If None, the bands are assumed \
+    evenly spaced over one year.
+    :type dates: list of numpy.datetime64 or days
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :returns days: numpy.ndarray with elapsed days of each band.
+    """
+    if dates is None:
+        return numpy.linspace(0, 365, bands, endpoint=False)
+
+    dates = numpy.asarray(dates)
+    if len(dates) != bands:
+        raise ValueError("The number of dates must match the number of "
+                         "bands.")
+
+    if numpy.issubdtype(dates.dtype, numpy.datetime64):
+        days = (dates - dates[0]) / numpy.timedelta64(1, "D")
+    else:
+        days = dates - dates[0]
+
+    return days.astype(numpy.double)
+
+
+def time_weight(days, weight_twdtw, alpha=None, beta=None):
+    """This function computes the TWDTW temporal weight between every \
+    pair of bands, as proposed by Maus et al. 2019.
+    :param days: Elapsed days of each band.
+    :type days: numpy.ndarray
+    :param weight_twdtw: Type of weight, logistic or linear.
+    :type weight_twdtw: string
+    :param alpha: Steepness (logistic) or slope (linear) of the weight. \
+    Default -0.1 (logistic) or 1/365 (linear).
+    :type alpha: float
+    :param beta: Midpoint (logistic) or offset (linear) of the weight. \
+    Default 100 (logistic) or 0 (linear).
+    :type beta: float
+    :returns weight: numpy.ndarray (bands, bands) with temporal weights.
+    """
+    # Elapsed time between each pair of acquisitions
+    g = numpy.abs(days[:, None] - days[None, :])
+
+    if weight_twdtw == "logistic":
+        # logistic weight inclination
+        alpha = -0.1 if alpha is None else alpha
+        # midpoint of logistic weight
+        beta = 100 if beta is None else beta
+        # Function for calculating the logistic temporal weight
+        weight = 1 / (1 + numpy.exp(alpha*(g - beta)))
+
+    elif weight_twdtw == "linear":
+        alpha = 1/365 if alpha is None else alpha
+        beta = 0 if beta is None else beta
+        # Function for calculating the linear temporal weight
+        weight = alpha*g + beta
+
+    else:
+        raise ValueError("Choose a twdtw weight (logistic or linear)")
+
+    return weight.astype(numpy.double)
+
+
+def dtw_options(distance_calculation, window=None, max_dist=None,
+                max_step=None, penalty=None, psi=None, variables=1):
+    """This function packs the warping options for the Numba kernels, \
+    following the conventions of dtaidistance (None or 0 disables).
+    :param distance_calculation: dtw or twdtw.
+    :type distance_calculation: string
+    :param window: Only allow for maximal shifts from the two diagonals \
+    smaller than this number.
+    :param max_dist: Stop if the returned values will be larger than \
+    this value.
+    :param max_step: Do not allow steps larger than this value.
+    :param penalty: Penalty to add if compression or expansion is applied.
+    :param psi: Psi relaxation parameter (ignore start and end of matching).
+    :param variables: Number of variables of each date. The series are \
+    date major (date 0 of every variable, then date 1...), and the cost of \
+    matching two dates adds the differences of every variable (dependent \
+    DTW/TWDTW).
+    :returns opts: Tuple (twdtw, window, max_step, penalty, psi, max_dist, \
+    variables).
+    """
+    twdtw = distance_calculation == "twdtw"
+    window = int(window) if window else 0
+    psi = int(psi) if psi else 0
+    max_step = float(max_step) if max_step else numpy.inf
+    max_dist = float(max_dist) if max_dist else numpy.inf
+    penalty = float(penalty) if penalty else 0.0
+
+    if not twdtw:
+        # DTW works on squared differences, as in dtaidistance
+        max_step = max_step**2
+        max_dist = max_dist**2
+        penalty = penalty**2
+
+    return (twdtw, window, max_step, penalty, psi, max_dist, int(variables))
+
+
+def warping_options(img, distance_calculation, weight_twdtw, dates=None,
+                    alpha=None, beta=None, window=None, max_dist=None,
+                    max_step=None, penalty=None, psi=None, variables=1,
+                    **kwargs):
+    """This function prepares the temporal weight and warping options of \
+    the Numba kernels for an image. The parameters are the same of snitc.
+    :param img: Normalized image, block or time series, with the bands on \
+    the last axis.
+    :type img: numpy.ndarray
+    :param kwargs: Other parameters of cluster, ignored.
+    :returns weight: Temporal weight between bands with the float type of \
+    img, zeros for DTW.
+    :returns opts: Warping options, see dtw_options.
+    """
+    times = img.shape[-1]//variables
+    if distance_calculation == "twdtw":
+        weight = time_weight(acquisition_days(dates, times), weight_twdtw,
+                             alpha, beta)
+    else:
+        weight = numpy.zeros((times, times))
+    opts = dtw_options(distance_calculation, window=window,
+                       max_dist=max_dist, max_step=max_step,
+                       penalty=penalty, psi=psi, variables=variables)
+
+    return weight.astype(img.dtype), opts
+
+
+@njit(cache=True)
+def warping_distance(x, y, weight, opts, buf):
+    """This function computes the DTW or TWDTW distance between two \
+    time series. For TWDTW the temporal weight is added to the cost of \
+    each cell of the warping matrix. Multivariate series warp all their \
+    variables together (dependent DTW).
+    :param x: Pixel time series.
+    :type x: numpy.ndarray
+    :param y: Cluster time series.
+    :type y: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :param buf: Work array with shape (2, bands+1).
+    :type buf: numpy.ndarray
+    :returns dist: Distance, or infinity if it is larger than max_dist.
+    """
+    # Infinity is used as sentinel, so fastmath must not be enabled here
+    twdtw, window, max_step, penalty, psi, max_dist, variables = opts
+    n = x.shape[0]//variables
+    if window == 0 or window > n:
+        window = n
+
+    prev = buf[0]
+    cur = buf[1]
+
+    # First row, relaxed by psi
+    prev[:] = numpy.inf
+    for j in range(min(psi, n) + 1):
+        prev[j] = 0.0
+
+    last = numpy.inf
+    for i in range(n):
+        cur[:] = numpy.inf
+        row_min = numpy.inf
+        # First column, relaxed by psi
+        if i < psi:
+            cur[0] = 0.0
+            row_min = 0.0
+
+        for j in range(max(0, i - window + 1), min(n, i + window)):
+            diff = x[i*variables] - y[j*variables]
+            if twdtw:
+                cost = abs(diff)
+            else:
+                cost = diff*diff
+            for v in range(1, variables):
+                diff = x[i*variables+v] - y[j*variables+v]
+                if twdtw:
+                    cost = cost + abs(diff)
+                else:
+                    cost = cost + diff*diff
+            if cost > max_step:
+                continue
+            if twdtw:
+                cost = cost + weight[i, j]
+
+            best = prev[j]
+            if prev[j+1] + penalty < best:
+                best = prev[j+1] + penalty
+            if cur[j] + penalty < best:
+                best = cur[j] + penalty
+            cur[j+1] = cost + best
+            if cur[j+1] < row_min:
+                row_min = cur[j+1]
+
+        # Early abandon, every path crosses the rows before psi relaxation
+        if row_min > max_dist and i < n - psi:
+            return numpy.inf
+
+        # Last column, relaxed by psi
+        if i >= n - psi - 1 and cur[n] < last:
+            last = cur[n]
+
+        tmp = prev
+        prev = cur
+        cur = tmp
+
+    # Last row, relaxed by psi
+    for j in range(n - min(psi, n), n + 1):
+        if prev[j] < last:
+            last = prev[j]
+
+    if last > max_dist:
+        return numpy.inf
+
+    if twdtw:
+        return last
+    return last**0.5
+
+
+@njit(parallel=True, cache=True)
+def twdtw_distances(subim, c_series, weight, opts):
+    """This function computes the DTW or TWDTW distance between every \
+    pixel of a block and the cluster time series in a single pass.
+    :param subim: View of the block of image, with shape (rows, columns, \
+    bands).
+    :type subim: numpy.ndarray
+    :param c_series: Average time series of cluster.
+    :type c_series: numpy.ndarray
+    :param weight: Temporal weight between bands, see time_weight.
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :returns dc: numpy.ndarray with the distance of each pixel.
+    """
+    rows, columns, bands = subim.shape
+    dc = numpy.empty((rows, columns), subim.dtype)
+
+    for r in prange(rows):
+        buf = numpy.empty((2, bands+1), subim.dtype)
+        for c in range(columns):
+            dc[r, c] = warping_distance(subim[r, c], c_series, weight, opts,
+                                        buf)
+
+    return dc
+
+
+def distance(c_series, ic, jc, subim, S, m, rmin, cmin,
+             window=None, max_dist=None, max_step=None, 
+             max_diff=None, penalty=None, psi=None, pruning=False):
+    """This function computes the spatial-temporal distance between \
+    two pixels using the DTW distance.
+    :param c_series: average time series of cluster.
+    :type c_series: numpy.ndarray
+    :param ic: X coordinate of cluster center.
+    :type ic: int
+    :param jc: Y coordinate of cluster center.
+    :type jc: int
+    :param subim: View of the block of image from the cluster under \
+    analysis, with shape (rows, columns, bands).
+    :type subim: numpy.ndarray
+    :param S: Pattern spacing value.
+    :type S: int
+    :param m: Compactness value.
+    :type m: float
+    :param rmin: Minimum row.
+    :type rmin: int
+    :param cmin: Minimum column.
+    :type cmin: int
+    :param window: Only allow for maximal shifts from the two diagonals \
+    smaller than this number. It includes the diagonal, meaning that an \
+    Euclidean distance is obtained by setting window=1.
+    :param max_dist: Stop if the returned values will be larger than \
+    this value.
+    :param max_step: Do not allow steps larger than this value.
+    :param max_diff: Return infinity if length of two series is larger.
+    :param penalty: Penalty to add if compression or expansion is applied.
+    :param psi: Psi relaxation parameter (ignore start and end of matching).
+        Useful for cyclical series.
+    :param use_pruning: Prune values based on Euclidean distance.
+    :returns D: numpy.ndarray distance.
+    """
+    from dtaidistance import dtw
+
+    # Normalizing factor
+    m = m/10
+
+    # Initialize submatrix
+    ds = numpy.zeros([subim.shape[0], subim.shape[1]])
+    
+    # Reshape block to allow dtw computation with dtaidistance
+    linear = subim.reshape(subim.shape[0]*subim.shape[1], subim.shape[2])
+    merge = numpy.vstack((linear, c_series)).astype(numpy.double)
+    
+    c = dtw.distance_matrix(merge, block=((0, merge.shape[0]),
+                        (merge.shape[0] - 1, merge.shape[0])),
+                        compact=True, use_c=True, parallel=True, use_mp=True)
+    c1 = numpy.array(c)
+    dc = c1.reshape(subim.shape[0], subim.shape[1])
+
+    x = numpy.arange(subim.shape[0])
+    y = numpy.arange(subim.shape[1])
+    xx, yy = numpy.meshgrid(x, y, sparse=True, indexing='ij')
+    # Calculate Spatial Distance
+    ds = (((xx-ic)**2 + (yy-jc)**2)**0.5)
+    # Calculate SPatial-temporal distance
+    D = (dc)/m+(ds/S)
+
+    return D
+
+
+@njit(cache=True)
+def envelope(c_series, weight, opts):
+    """This function computes the LB_Keogh envelope of the cluster time \
+    series for the warping window, for each variable, and the smallest \
+    temporal weight that each date can receive inside the window.
+    :param c_series: Average time series of cluster.
+    :type c_series: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :returns lower: Lower envelope.
+    :returns upper: Upper envelope.
+    :returns wmin: Minimum temporal weight of each date.
+    """
+    twdtw, window, max_step, penalty, psi, max_dist, variables = opts
+    n = c_series.shape[0]//variables
+    if window == 0 or window > n:
+        window = n
+
+    lower = numpy.empty(c_series.shape[0], c_series.dtype)
+    upper = numpy.empty(c_series.shape[0], c_series.dtype)
+    wmin = numpy.zeros(c_series.shape[0], c_series.dtype)
+
+    for i in range(n):
+        jmin = max(0, i - window + 1)
+        jmax = min(n, i + window)
+        for v in range(variables):
+            band = c_series[jmin*variables+v:jmax*variables:variables]
+            lower[i*variables+v] = band.min()
+            upper[i*variables+v] = band.max()
+        if twdtw:
+            wmin[i] = weight[i, jmin:jmax].min()
+
+    return lower, upper, wmin
+
+
+@njit(cache=True)
+def lb_kim(x, y, weight, twdtw, variables=1):
+    """This function computes LB_Kim, the cost of the first and last \
+    cells of the warping path. Not valid with psi relaxation.
+    :param x: Pixel time series.
+    :type x: numpy.ndarray
+    :param y: Cluster time series.
+    :type y: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param twdtw: Whether the temporal weight is used.
+    :type twdtw: bool
+    :param variables: Number of variables of each date.
+    :type variables: int
+    :returns lb: Lower bound, squared for DTW.
+    """
+    n = x.shape[0]//variables
+
+    lb = 0.0
+    for i in range(0, n, max(n - 1, 1)):
+        for v in range(variables):
+            diff = x[i*variables+v] - y[i*variables+v]
+            if twdtw:
+                lb = lb + abs(diff)
+            else:
+                lb = lb + diff*diff
+        if twdtw:
+            lb = lb + weight[i, i]
+
+    return lb
+
+
+@njit(cache=True)
+def lb_keogh(x, lower, upper, wmin, psi, twdtw, variables=1):
+    """This function computes LB_Keogh of a time series against the \
+    envelope of the cluster time series. With psi relaxation only the \
+    bands that every warping path must match are used.
+    :param x: Pixel time series.
+    :type x: numpy.ndarray
+    :param lower: Lower envelope.
+    :type lower: numpy.ndarray
+    :param upper: Upper envelope.
+    :type upper: numpy.ndarray
+    :param wmin: Minimum temporal weight of each band.
+    :type wmin: numpy.ndarray
+    :param psi: Psi relaxation parameter.
+    :type psi: int
+    :param twdtw: Whether the temporal weight is used.
+    :type twdtw: bool
+    :param variables: Number of variables of each date.
+    :type variables: int
+    :returns lb: Lower bound, squared for DTW.
+    """
+    n = x.shape[0]//variables
+    lb = 0.0
+
+    for i in range(psi, n - psi):
+        for b in range(i*variables, (i + 1)*variables):
+            if x[b] > upper[b]:
+                diff = x[b] - upper[b]
+            elif x[b] < lower[b]:
+                diff = lower[b] - x[b]
+            else:
+                diff = 0.0
+
+            if twdtw:
+                lb = lb + diff
+            else:
+                lb = lb + diff*diff
+        if twdtw:
+            lb = lb + wmin[i]
+
+    return lb
+
+
+@njit(cache=True)
+def pixel_distance(x, c_series, ds, bound, m, lower, upper, wmin, weight,
+                   opts, pruning, buf, count):
+    """This function computes the spatial-temporal distance between a \
+    pixel and a cluster. With pruning, the spatial distance, LB_Kim and \
+    LB_Keogh are checked against the bound, and the warping is abandoned \
+    once it exceeds it.
+    :param x: Pixel time series.
+    :type x: numpy.ndarray
+    :param c_series: Average time series of cluster.
+    :type c_series: numpy.ndarray
+    :param ds: Spatial distance, already divided by S.
+    :type ds: float
+    :param bound: Distance the pixel must beat to change label.
+    :type bound: float
+    :param m: Normalized compactness value (m/10).
+    :type m: float
+    :param lower: Lower envelope of the cluster time series.
+    :type lower: numpy.ndarray
+    :param upper: Upper envelope of the cluster time series.
+    :type upper: numpy.ndarray
+    :param wmin: Minimum temporal weight of each band.
+    :type wmin: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :param pruning: Skip pixels that cannot beat the bound.
+    :type pruning: bool
+    :param buf: Work array with shape (2, bands+1) and the float type of \
+    the distance matrix.
+    :type buf: numpy.ndarray
+    :param count: Number of warping distances computed and pruned, \
+    updated in place.
+    :type count: numpy.ndarray
+    :returns D: Distance rounded to the float type of buf, or infinity if \
+    it cannot be smaller than bound.
+    """
+    twdtw, window, max_step, penalty, psi, max_dist, variables = opts
+
+    # Relative slack so rounding never prunes a pixel that could change
+    tol = 1e-9
+
+    pixel_opts = opts
+    if pruning:
+        if ds > bound:
+            count[1] += 1
+            return numpy.inf
+
+        # Largest temporal distance that still changes the label
+        limit = (bound - ds)*m*(1 + tol)
+        if not twdtw:
+            limit = limit*limit
+
+        if psi == 0 and lb_kim(x, c_series, weight, twdtw,
+                               variables) > limit:
+            count[1] += 1
+            return numpy.inf
+        if lb_keogh(x, lower, upper, wmin, psi, twdtw, variables) > limit:
+            count[1] += 1
+            return numpy.inf
+
+        pixel_opts = (twdtw, window, max_step, penalty, psi,
+                      min(max_dist, limit), variables)
+
+    count[0] += 1
+    dc = warping_distance(x, c_series, weight, pixel_opts, buf)
+
+    # Calculate SPatial-temporal distance, rounded as it will be stored so
+    # that ties are broken the same way by every engine
+    buf[0, 0] = dc/m + ds
+    return buf[0, 0]
@@ -0,0 +1,299 @@
+"""Vector export of the segmentation and attributes of the segments."""
+import numpy
+from numba import njit, prange
+
+from .assign import label_index
+from .distance import warping_distance, warping_options
+
+
+def write_pandas(segmentation, transform, crs):
+    """This function creates a GeoPandas DataFrame \
+    of the segmentation. Masked pixels (label -1) are dropped.
+    :param segmentation: Segmentation numpy array.
+    :type segmentation: numpy.ndarray
+    :param transform: Transformation parameters.
+    :type transform: list
+    :param crs: Coordinate Reference System.
+    :type crs: PROJ4 dict
+    :returns gdf: Segmentation as a geopandas geodataframe.
+    """
+    import geopandas
+    import rasterio.features
+    from shapely.geometry import shape
+
+    mypoly = []
+
+    # rasterio only vectorizes integers up to int32, float32 would merge
+    # the labels above 2**24
+    if segmentation.max() > numpy.iinfo(numpy.int32).max:
+        raise ValueError("The labels do not fit in int32.")
+
+    # Loop to oconvert raster conneted components to
+    # polygons using rasterio features
+    seg = segmentation.astype(dtype=numpy.int32)
+    for vec in rasterio.features.shapes(seg, mask=segmentation >= 0,
+                                        transform=transform):
+        mypoly.append(shape(vec[0]))
+
+    gdf = geopandas.GeoDataFrame(geometry=mypoly, crs=crs)
+    gdf.crs = crs
+
+    mypoly = None
+
+    return gdf
+
+
+def segment_attributes(segmentation, img, l, C, distance_calculation="dtw",
+                       weight_twdtw="logistic", dates=None, alpha=None,
+                       beta=None, window=None, max_step=None, penalty=None,
+                       psi=None, variables=1):
+    """This function computes the attributes of each segment in a single \
+    pass over the image: number of pixels, cluster (the most frequent \
+    label of its pixels), mean time series of the cluster taken from the \
+    final C, and dispersion (mean DTW/TWDTW distance between its pixels \
+    and that series).
+    :param segmentation: Segmentation with consecutive labels, see \
+    postprocessing.
+    :type segmentation: numpy.ndarray
+    :param img: Normalized image with shape (rows, columns, bands).
+    :type img: numpy.ndarray
+    :param l: Matrix label of the clusters.
+    :type l: numpy.ndarray
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :param distance_calculation: dtw or twdtw, see snitc.
+    :type distance_calculation: string
+    :param weight_twdtw: Type of TWDTW weight, logistic or linear.
+    :type weight_twdtw: string
+    :param variables: Number of variables of each date, see dtw_options.
+    :type variables: int
+    :returns attributes: pandas.DataFrame indexed by segment label with \
+    the columns pixels, cluster, dispersion and mean_0...mean_n.
+    """
+    import pandas as pd
+
+    bands = img.shape[2]
+    n = int(segmentation.max()) + 1
+
+    weight, opts = warping_options(img, distance_calculation, weight_twdtw,
+                                   dates=dates, alpha=alpha, beta=beta,
+                                   window=window, max_step=max_step,
+                                   penalty=penalty, psi=psi,
+                                   variables=variables)
+
+    start, index = label_index(segmentation, n)
+    cluster, dispersion = segment_statistics(img, numpy.ascontiguousarray(l),
+                                             start, index, C, weight, opts)
+
+    series = numpy.full((n, bands), numpy.nan)
+    valid = cluster >= 0
+    series[valid] = C[cluster[valid], :bands]
+
+    attributes = pd.DataFrame({"pixels": numpy.diff(start),
+                               "cluster": cluster,
+                               "dispersion": dispersion})
+    for b in range(bands):
+        attributes["mean_%d" % b] = series[:, b]
+    attributes.index.name = "label"
+
+    return attributes
+
+
+@njit(parallel=True, cache=True)
+def segment_statistics(img, la, start, index, C, weight, opts):
+    """This function finds the cluster of each segment and the mean \
+    warping distance between its pixels and the cluster time series.
+    :param img: Normalized image with shape (rows, columns, bands).
+    :type img: numpy.ndarray
+    :param la: Matrix label of the clusters.
+    :type la: numpy.ndarray
+    :param start: Position in index of the first pixel of each segment.
+    :type start: numpy.ndarray
+    :param index: Pixels sorted by segment, see label_index.
+    :type index: numpy.ndarray
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :returns cluster: Most frequent cluster of each segment, the smallest \
+    on ties, or -1.
+    :returns dispersion: Mean warping distance of each segment.
+    """
+    rows, columns, bands = img.shape
+    n = start.shape[0] - 1
+    flat = la.reshape(rows*columns)
+
+    cluster = numpy.full(n, -1, dtype=numpy.int64)
+    dispersion = numpy.full(n, numpy.nan)
+
+    for s in prange(n):
+        if start[s+1] == start[s]:
+            continue
+
+        # Most frequent cluster of the segment
+        labels = numpy.sort(flat[index[start[s]:start[s+1]]])
+        best = labels[0]
+        best_count = 0
+        run = 0
+        for i in range(labels.shape[0]):
+            if i > 0 and labels[i] == labels[i-1]:
+                run += 1
+            else:
+                run = 1
+            if run > best_count:
+                best = labels[i]
+                best_count = run
+        if best < 0:
+            continue
+        cluster[s] = best
+
+        buf = numpy.empty((2, bands+1), img.dtype)
+        total = 0.0
+        for i in range(start[s], start[s+1]):
+            r = index[i]//columns
+            c = index[i] % columns
+            total += warping_distance(img[r, c], C[best, :bands], weight,
+                                      opts, buf)
+        dispersion[s] = total/(start[s+1] - start[s])
+
+    return cluster, dispersion
+
+
+@njit(cache=True)
+def segment_rows(segmentation, n):
+    """This function finds the first and last row of each segment.
+    :param segmentation: Segmentation with labels 0..n-1.
+    :type segmentation: numpy.ndarray
+    :param n: Number of segments.
+    :type n: int
+    :returns first: First row of each segment, rows if it has no pixels.
+    :returns last: Last row of each segment, -1 if it has no pixels.
+    """
+    rows, columns = segmentation.shape
+    first = numpy.full(n, rows, dtype=numpy.int64)
+    last = numpy.full(n, -1, dtype=numpy.int64)
+
+    for r in range(rows):
+        for c in range(columns):
+            s = segmentation[r, c]
+            if s < 0 or s >= n:
+                continue
+            if r < first[s]:
+                first[s] = r
+            last[s] = r
+
+    return first, last
+
+
+def write_segments(segmentation, dst_path, transform, crs, attributes=None,
+                   driver=None, chunk=10000):
+    """This function polygonizes the segmentation in chunks of segments \
+    and writes each chunk to the output file as soon as it is ready, so \
+    that the polygons of the whole scene are never held in memory. Each \
+    chunk only reads the rows covered by its segments. FlatGeobuf cannot \
+    be appended to, so its chunks are written to a temporary GeoPackage \
+    that is streamed to FlatGeobuf at the end (pyogrio.raw.write_arrow).
+    :param segmentation: Segmentation with consecutive labels, see \
+    postprocessing. Masked pixels (label -1) are dropped.
+    :type segmentation: numpy.ndarray
+    :param dst_path: Output file. GeoParquet output is a directory with a \
+    file per chunk, that geopandas.read_parquet reads as one dataset.
+    :type dst_path: string
+    :param transform: Transformation parameters.
+    :type transform: list
+    :param crs: Coordinate Reference System.
+    :type crs: PROJ4 dict
+    :param attributes: Attributes of each segment, indexed by label, see \
+    segment_attributes.
+    :type attributes: pandas.DataFrame
+    :param driver: GPKG, FlatGeobuf, Parquet or ESRI Shapefile. Default is \
+    given by the extension of dst_path.
+    :type driver: string
+    :param chunk: Number of segments of each chunk.
+    :type chunk: int
+    :returns dst_path: Path of the vector file.
+    """
+    import os
+    import geopandas
+    import pandas as pd
+    import rasterio.features
+    from rasterio.transform import Affine
+    from rasterio.windows import Window, transform as window_transform
+    from shapely.geometry import shape
+    from shapely.ops import unary_union
+
+    # xarray keeps the transform as a tuple
+    transform = Affine(*tuple(transform)[:6])
+
+    if driver is None:
+        drivers = {".gpkg": "GPKG", ".fgb": "FlatGeobuf",
+                   ".parquet": "Parquet", ".shp": "ESRI Shapefile"}
+        extension = os.path.splitext(dst_path)[1].lower()
+        if extension not in drivers:
+            raise ValueError("Unknown vector format %s, use gpkg, fgb, "
+                             "parquet or shp." % extension)
+        driver = drivers[extension]
+    if driver == "Parquet":
+        os.makedirs(dst_path, exist_ok=True)
+    path = dst_path
+    if driver == "FlatGeobuf":
+        path = dst_path + ".tmp.gpkg"
+
+    n = int(segmentation.max()) + 1
+    first, last = segment_rows(segmentation, n)
+
+    # Segments sorted by their first row, so each chunk reads few rows
+    order = numpy.argsort(first, kind="stable")
+    order = order[first[order] < segmentation.shape[0]]
+    selected = numpy.zeros(n, dtype=bool)
+
+    for part, i in enumerate(range(0, len(order), chunk)):
+        labels = order[i:i+chunk]
+        r0 = int(first[labels].min())
+        r1 = int(last[labels].max()) + 1
+        block = segmentation[r0:r1]
+
+        selected[labels] = True
+        mask = selected[block] & (block >= 0)
+        selected[labels] = False
+
+        # Polygonize the chunk, segments split in several polygons are
+        # kept as one multipolygon
+        lo = int(labels.min())
+        values = (block - lo).astype(numpy.int32)
+        polygons = {}
+        win = Window(0, r0, segmentation.shape[1], r1 - r0)
+        for geom, value in rasterio.features.shapes(
+                values, mask=mask, transform=window_transform(win, transform)):
+            polygons.setdefault(int(value) + lo, []).append(shape(geom))
+
+        keys = sorted(polygons)
+        geometry = [polygons[key][0] if len(polygons[key]) == 1
+                    else unary_union(polygons[key]) for key in keys]
+        data = pd.DataFrame({"label": keys})
+        if attributes is not None:
+            data = data.join(attributes, on="label")
+        gdf = geopandas.GeoDataFrame(data, geometry=geometry, crs=crs)
+
+        if driver == "Parquet":
+            gdf.to_parquet(os.path.join(dst_path, "part-%05d.parquet" % part),
+                           index=False)
+        else:
+            gdf.to_file(path, driver="GPKG" if path != dst_path else driver,
+                        mode="w" if part == 0 else "a")
+
+    if path != dst_path:
+        from pyogrio.raw import open_arrow, write_arrow
+
+        # Batches of features, the polygons are never all in memory
+        with open_arrow(path, use_pyarrow=False,
+                        batch_size=chunk) as (meta, reader):
+            write_arrow(reader, dst_path, driver=driver,
+                        geometry_name=meta["geometry_name"],
+                        geometry_type="Unknown", crs=meta["crs"],
+                        encoding=meta["encoding"])
+        os.remove(path)
+
+    return dst_path
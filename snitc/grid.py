@@ -0,0 +1,243 @@
+"""Initial cluster centres of SNITC."""
+import numpy
+from numba import njit
+
+
+@njit(fastmath=True, cache=True)
+def init_cluster_hex(rows, columns, ki, img, bands):
+    """This function initialize the clusters for SNITC\
+    using a hexagonal pattern.
+    :param rows: Number of rows of image.
+    :type rows: int
+    :param columns: Number of columns of image.
+    :type columns: int
+    :param ki: Number of desired superpixel.
+    :type ki: int
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :returns C: ND-array containing cluster centres information.
+    :returns S: Spacing between clusters.
+    :returns l: Matrix label.
+    :returns d: Distance matrix from cluster centres.
+    :returns k: Number of superpixels that will be produced.
+    """
+    positions, S = grid_hex(rows, columns, ki)
+
+    # Allocate memory and initialise clusters, labels and distances
+    # Cluster centre data  1:times is mean on each band of series
+    # times+1 and times+2 is row, col of centre, times+3 is No of pixels
+    C = grid_centres(img, positions, bands)
+    k = C.shape[0]
+
+    # Matrix labels.
+    labelled = numpy.full(img.shape[:2], -1, numpy.int32)
+
+    # Pixel distance matrix from cluster centres.
+    d = numpy.full(img.shape[:2], numpy.inf, img.dtype)
+
+    return C, S, labelled, d, k
+
+
+@njit(fastmath=True, cache=True)
+def init_cluster_regular(rows, columns, ki, img, bands):
+    """This function initialize the clusters for SNITC using a square pattern.
+    :param rows: Number of rows of image.
+    :type rows: int
+    :param columns: Number of columns of image.
+    :type columns: int
+    :param ki: Number of desired superpixel.
+    :type ki: int
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :returns C: ND-array containing cluster centres information.
+    :returns S: Spacing between clusters.
+    :returns l: Matrix label.
+    :returns d: Distance matrix from cluster centres.
+    :returns k: Number of superpixels that will be produced.
+    """
+    positions, S = grid_regular(rows, columns, ki)
+
+    # Allocate memory and initialise clusters, labels and distances.
+    # Cluster centre data 1:times is mean on each band of series
+    C = grid_centres(img, positions, bands)
+    k = C.shape[0]
+
+    # Matrix labels.
+    labelled = numpy.full(img.shape[:2], -1, numpy.int32)
+
+    # Pixel distance matrix from cluster centres.
+    d = numpy.full(img.shape[:2], numpy.inf, img.dtype)
+
+    return C, S, labelled, d, k
+
+
+@njit(fastmath=True, cache=True)
+def grid_hex(rows, columns, ki):
+    """This function computes the positions of the cluster centres in a \
+    hexagonal pattern.
+    :param rows: Number of rows of image.
+    :type rows: int
+    :param columns: Number of columns of image.
+    :type columns: int
+    :param ki: Number of desired superpixel.
+    :type ki: int
+    :returns positions: ND-array with row and column of each centre.
+    :returns S: Spacing between clusters.
+    """
+    # Setting up SNITC
+    S = (rows*columns / (ki * (3**0.5)/2))**0.5
+
+    # Get nodes per row allowing a half column margin
+    nodeColumns = round(columns/S - 0.5)
+
+    # Given an integer number of nodes per row recompute S
+    S = columns/(nodeColumns + 0.5)
+
+    # Get number of rows of nodes allowing 0.5 row margin top and bottom
+    nodeRows = round(rows/((3)**0.5/2*S))
+    vSpacing = rows/nodeRows
+
+    # Recompute k
+    k = nodeRows * nodeColumns
+    positions = numpy.zeros((k, 2), dtype=numpy.int64)
+
+    # Initialise grid
+    kk = 0
+    r = vSpacing/2
+    for ri in range(nodeRows):
+        x = ri
+        if x % 2:
+            c = S/2
+        else:
+            c = S
+
+        for ci in range(nodeColumns):
+            positions[kk, 0] = int(numpy.floor(r))
+            positions[kk, 1] = int(numpy.floor(c))
+            c = c+S
+            kk = kk+1
+
+        r = r+vSpacing
+
+    # Cast S
+    S = round(S)
+
+    return positions, S
+
+
+@njit(fastmath=True, cache=True)
+def grid_regular(rows, columns, ki):
+    """This function computes the positions of the cluster centres in a \
+    square pattern.
+    :param rows: Number of rows of image.
+    :type rows: int
+    :param columns: Number of columns of image.
+    :type columns: int
+    :param ki: Number of desired superpixel.
+    :type ki: int
+    :returns positions: ND-array with row and column of each centre.
+    :returns S: Spacing between clusters.
+    """
+    N = rows * columns
+
+    # Setting up SLIC
+    S = int((N/ki)**0.5)
+    base = int(S/2)
+
+    vSpacing = int(numpy.floor(rows / ki**0.5))
+    hSpacing = int(numpy.floor(columns / ki**0.5))
+
+    k = len(range(base, rows, vSpacing))*len(range(base, columns, hSpacing))
+    positions = numpy.zeros((k, 2), dtype=numpy.int64)
+
+    kk = 0
+
+    # Initialise grid
+    for x in range(base, rows, vSpacing):
+        for y in range(base, columns, hSpacing):
+            positions[kk, 0] = x
+            positions[kk, 1] = y
+            kk = kk+1
+
+    return positions, S
+
+
+@njit(fastmath=True, cache=True)
+def grid_centres(img, positions, bands):
+    """This function initialize the cluster centres with the time series \
+    at the given positions.
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param positions: ND-array with row and column of each centre.
+    :type positions: numpy.ndarray
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :returns C: ND-array containing cluster centres information.
+    """
+    k = positions.shape[0]
+    C = numpy.zeros((k, bands+3), img.dtype)
+
+    for kk in range(k):
+        rr = positions[kk, 0]
+        cc = positions[kk, 1]
+        C[kk, :bands] = img[rr, cc]
+        C[kk, bands] = rr
+        C[kk, bands+1] = cc
+
+    return C
+
+
+@njit(cache=True)
+def move_centres(C, img, mask, S, bands):
+    """This function moves the cluster centres that fall on masked pixels \
+    to the nearest valid pixel of their cell (S//2 pixels around the \
+    centre), taking its time series, so that valid areas narrower than \
+    the spacing (islands, coastal strips) are still clustered.
+    :param C: ND-array containing cluster centres information, updated in \
+    place.
+    :type C: numpy.ndarray
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param mask: Valid pixels.
+    :type mask: numpy.ndarray
+    :param S: Spacing between clusters.
+    :type S: int
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :returns keep: Centres on a valid pixel, False for the centres \
+    without any valid pixel in their cell.
+    """
+    rows, columns = mask.shape
+    half = S//2
+    keep = numpy.zeros(C.shape[0], dtype=numpy.bool_)
+
+    for kk in range(C.shape[0]):
+        rr = min(max(int(numpy.floor(C[kk, bands])), 0), rows - 1)
+        cc = min(max(int(numpy.floor(C[kk, bands+1])), 0), columns - 1)
+        if mask[rr, cc]:
+            keep[kk] = True
+            continue
+
+        # Nearest valid pixel, the first in row order on ties
+        best = -1
+        br = rr
+        bc = cc
+        for r in range(max(rr - half, 0), min(rr + half + 1, rows)):
+            for c in range(max(cc - half, 0), min(cc + half + 1, columns)):
+                if mask[r, c]:
+                    dist = (r - rr)**2 + (c - cc)**2
+                    if best < 0 or dist < best:
+                        best = dist
+                        br = r
+                        bc = c
+        if best >= 0:
+            C[kk, :bands] = img[br, bc]
+            C[kk, bands] = br
+            C[kk, bands+1] = bc
+            keep[kk] = True
+
+    return keep
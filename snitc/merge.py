@@ -0,0 +1,286 @@
+"""Region adjacency graph merging of the superpixels."""
+import heapq
+
+import numpy
+from numba import njit, prange, types
+from numba.typed import Dict, List
+
+from .distance import warping_distance, warping_options
+
+
+def merge_segments(segmentation, l, C, threshold=None, segments=None,
+                   distance_calculation="dtw", weight_twdtw="logistic",
+                   dates=None, alpha=None, beta=None, window=None,
+                   max_step=None, penalty=None, psi=None, variables=1):
+    """This function merges adjacent segments with similar time series. \
+    The region adjacency graph is built from the segmentation, the series \
+    of each segment is the final centre of its cluster, and the pair of \
+    adjacent segments with the smallest DTW/TWDTW distance is merged first, \
+    the series of the merged segment being the mean of both weighted by \
+    their number of pixels. The image is not read again.
+    :param segmentation: Segmentation with consecutive labels and -1 for \
+    masked pixels, see postprocessing.
+    :type segmentation: numpy.ndarray
+    :param l: Matrix label of the clusters.
+    :type l: numpy.ndarray
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :param threshold: Largest distance between two merged segments.
+    :type threshold: float
+    :param segments: Number of segments where merging stops.
+    :type segments: int
+    :param distance_calculation: dtw or twdtw, see snitc.
+    :type distance_calculation: string
+    :param weight_twdtw: Type of TWDTW weight, logistic or linear.
+    :type weight_twdtw: string
+    :param variables: Number of variables of each date, see dtw_options.
+    :type variables: int
+    :returns merged: Segmentation with consecutive labels starting at 0, \
+    and -1 for masked pixels.
+    """
+    if threshold is None and segments is None:
+        raise ValueError("Give the threshold or the number of segments.")
+
+    n = int(segmentation.max()) + 1
+    if n <= 0:
+        return segmentation.copy()
+
+    series = segment_series(segmentation, l, C)
+    sizes = numpy.bincount(segmentation[segmentation >= 0].ravel(),
+                           minlength=n).astype(numpy.float64)
+
+    # Distances above the threshold are abandoned
+    weight, opts = warping_options(series, distance_calculation, weight_twdtw,
+                                   dates=dates, alpha=alpha, beta=beta,
+                                   window=window, max_dist=threshold,
+                                   max_step=max_step, penalty=penalty,
+                                   psi=psi, variables=variables)
+    limit = numpy.inf if threshold is None else float(threshold)
+    target = 1 if segments is None else max(int(segments), 1)
+
+    a, b = region_adjacency(numpy.ascontiguousarray(segmentation), n)[:2]
+    dist = edge_distances(series, a, b, weight, opts)
+    lookup = merge_regions(series, sizes, a, b, dist, weight, opts, limit,
+                           target)
+
+    lookup = lookup.astype(segmentation.dtype)
+    merged = lookup[segmentation]
+    merged[segmentation < 0] = -1
+
+    return merged
+
+
+def segment_series(segmentation, l, C):
+    """This function takes the time series of each segment from the \
+    final C, the centre of the most frequent cluster of its pixels (the \
+    smallest on ties).
+    :param segmentation: Segmentation with consecutive labels and -1 for \
+    masked pixels, see postprocessing.
+    :type segmentation: numpy.ndarray
+    :param l: Matrix label of the clusters.
+    :type l: numpy.ndarray
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :returns series: Time series of each segment, NaN for segments \
+    without cluster.
+    """
+    k = C.shape[0]
+    n = int(segmentation.max()) + 1
+    valid = (segmentation >= 0) & (l >= 0)
+
+    pairs, count = numpy.unique(segmentation[valid].astype(numpy.int64)*k +
+                                l[valid], return_counts=True)
+    ps = pairs//k
+    pc = pairs % k
+    order = numpy.lexsort((pc, -count, ps))
+    first = order[numpy.r_[True, ps[order][1:] != ps[order][:-1]]]
+
+    series = numpy.full((max(n, 0), C.shape[1] - 3), numpy.nan)
+    series[ps[first]] = C[pc[first], :-3]
+
+    return series
+
+
+@njit(cache=True)
+def region_adjacency(segmentation, n):
+    """This function builds the region adjacency graph (4-connectivity) of \
+    a segmentation in one pass over its pixels.
+    :param segmentation: Segmentation with labels 0..n-1, negative labels \
+    are ignored.
+    :type segmentation: numpy.ndarray
+    :param n: Number of segments.
+    :type n: int
+    :returns a: Smallest segment of each edge.
+    :returns b: Largest segment of each edge, edges sorted by (a, b).
+    :returns border: Number of pixel borders of each edge.
+    """
+    rows, columns = segmentation.shape
+    edges = Dict.empty(key_type=types.int64, value_type=types.int64)
+
+    for r in range(rows):
+        for c in range(columns):
+            x = segmentation[r, c]
+            if x < 0:
+                continue
+            for t in range(2):
+                if t == 0:
+                    if c + 1 >= columns:
+                        continue
+                    y = segmentation[r, c+1]
+                else:
+                    if r + 1 >= rows:
+                        continue
+                    y = segmentation[r+1, c]
+                if y < 0 or y == x:
+                    continue
+                key = min(x, y)*n + max(x, y)
+                edges[key] = edges.get(key, 0) + 1
+
+    keys = numpy.empty(len(edges), dtype=numpy.int64)
+    i = 0
+    for key in edges.keys():
+        keys[i] = key
+        i += 1
+    keys.sort()
+
+    border = numpy.empty(keys.shape[0], dtype=numpy.int64)
+    for i in range(keys.shape[0]):
+        border[i] = edges[keys[i]]
+
+    return keys//n, keys % n, border
+
+
+@njit(parallel=True, cache=True)
+def edge_distances(series, a, b, weight, opts):
+    """This function computes the warping distance of each edge of the \
+    region adjacency graph.
+    :param series: Time series of each segment.
+    :type series: numpy.ndarray
+    :param a: First segment of each edge.
+    :type a: numpy.ndarray
+    :param b: Second segment of each edge.
+    :type b: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :returns dist: Distance of each edge, infinity if a series is missing.
+    """
+    bands = series.shape[1]
+    dist = numpy.empty(a.shape[0])
+
+    for e in prange(a.shape[0]):
+        buf = numpy.empty((2, bands+1))
+        dist[e] = segment_distance(series[a[e]], series[b[e]], weight, opts,
+                                   buf)
+
+    return dist
+
+
+@njit(cache=True)
+def segment_distance(x, y, weight, opts, buf):
+    """This function computes the warping distance between the series of \
+    two segments, infinity if any of them is missing.
+    :param x: Time series of a segment.
+    :type x: numpy.ndarray
+    :param y: Time series of a segment.
+    :type y: numpy.ndarray
+    :param weight: Temporal weight between bands (only used by TWDTW).
+    :type weight: numpy.ndarray
+    :param opts: Warping options, see dtw_options.
+    :type opts: tuple
+    :param buf: Work array with shape (2, bands+1).
+    :type buf: numpy.ndarray
+    :returns dist: Distance.
+    """
+    dist = warping_distance(x, y, weight, opts, buf)
+    if numpy.isnan(dist):
+        return numpy.inf
+    return dist
+
+
+@njit(cache=True)
+def merge_regions(series, sizes, a, b, dist, weight, opts, limit, target):
+    """This function merges the regions of the adjacency graph greedily, \
+    the closest pair first, with a priority queue. Queue entries of \
+    regions that changed since they were pushed are skipped when popped.
+    :param series: Time series of each region, updated in place.
+    :type series: numpy.ndarray
+    :param sizes: Number of pixels of each region, updated in place.
+    :type sizes: numpy.ndarray
+    :param a: First region of each edge.
+    :type a: numpy.ndarray
+    :param b: Second region of each edge.
+    :type b: numpy.ndarray
+    :param dist: Distance of each edge.
+    :type dist: numpy.ndarray
+    :param limit: Largest distance of a merge.
+    :type limit: float
+    :param target: Number of regions where merging stops.
+    :type target: int
+    :returns lookup: Consecutive label of the merged region of each region.
+    """
+    n, bands = series.shape
+    parent = numpy.arange(n)
+    stamp = numpy.zeros(n, dtype=numpy.int64)
+    buf = numpy.empty((2, bands+1))
+
+    neighbours = List()
+    for x in range(n):
+        neighbours.append(Dict.empty(key_type=types.int64,
+                                     value_type=types.int64))
+
+    heap = [(0.0, 0, 0, 0, 0)]
+    heap.pop()
+    for e in range(a.shape[0]):
+        neighbours[a[e]][b[e]] = 1
+        neighbours[b[e]][a[e]] = 1
+        if dist[e] <= limit:
+            heap.append((dist[e], a[e], b[e], 0, 0))
+    heapq.heapify(heap)
+
+    regions = n
+    while regions > target and len(heap) > 0:
+        D, x, y, sx, sy = heapq.heappop(heap)
+        # The regions changed after the entry was pushed
+        if stamp[x] != sx or stamp[y] != sy:
+            continue
+
+        # y is merged into x, the smallest label
+        total = sizes[x] + sizes[y]
+        for i in range(bands):
+            series[x, i] = (series[x, i]*sizes[x] +
+                            series[y, i]*sizes[y])/total
+        sizes[x] = total
+        parent[y] = x
+        stamp[x] += 1
+        stamp[y] = -1
+        regions -= 1
+
+        for z in neighbours[y].keys():
+            if z != x:
+                neighbours[x][z] = 1
+                neighbours[z][x] = 1
+            neighbours[z].pop(y)
+        neighbours[y].clear()
+
+        # Distances of the merged region to its neighbours
+        for z in neighbours[x].keys():
+            D = segment_distance(series[x], series[z], weight, opts, buf)
+            if D <= limit:
+                if x < z:
+                    heapq.heappush(heap, (D, x, z, stamp[x], stamp[z]))
+                else:
+                    heapq.heappush(heap, (D, z, x, stamp[z], stamp[x]))
+
+    # Consecutive labels of the merged regions
+    lookup = numpy.empty(n, dtype=numpy.int64)
+    m = 0
+    for x in range(n):
+        if parent[x] == x:
+            lookup[x] = m
+            m += 1
+        else:
+            lookup[x] = lookup[parent[x]]
+
+    return lookup
@@ -0,0 +1,140 @@
+"""Quality metrics of the superpixels."""
+import numpy
+from numba import njit
+
+from .assign import label_index
+from .distance import warping_options
+from .export import segment_statistics
+from .merge import edge_distances, region_adjacency, segment_series
+
+METRICS = ("size", "heterogeneity", "contrast", "compactness")
+
+
+def segment_metrics(segmentation, img=None, l=None, C=None, metrics=METRICS,
+                    distance_calculation="dtw", weight_twdtw="logistic",
+                    dates=None, alpha=None, beta=None, window=None,
+                    max_step=None, penalty=None, psi=None, variables=1):
+    """This function computes quality metrics of each segment, each one \
+    only if it is asked for:
+
+    - size: number of pixels.
+    - heterogeneity: mean DTW/TWDTW distance between the pixels and the \
+    series of the segment (one warping per pixel).
+    - contrast: mean DTW/TWDTW distance between the series of the segment \
+    and those of its neighbours, weighted by the length of their borders \
+    (one warping per pair of neighbours).
+    - compactness: 4π area / perimeter², with the perimeter counted in \
+    pixel sides.
+
+    The series of a segment is the final centre of its most frequent \
+    cluster, see segment_series.
+    :param segmentation: Segmentation with consecutive labels and -1 for \
+    masked pixels, see postprocessing.
+    :type segmentation: numpy.ndarray
+    :param img: Normalized image with shape (rows, columns, bands), only \
+    needed by heterogeneity.
+    :type img: numpy.ndarray
+    :param l: Matrix label of the clusters, needed by heterogeneity and \
+    contrast.
+    :type l: numpy.ndarray
+    :param C: ND-array containing cluster centres information, needed by \
+    heterogeneity and contrast.
+    :type C: numpy.ndarray
+    :param metrics: Names of the metrics.
+    :type metrics: tuple
+    :param distance_calculation: dtw or twdtw, see snitc.
+    :type distance_calculation: string
+    :param weight_twdtw: Type of TWDTW weight, logistic or linear.
+    :type weight_twdtw: string
+    :param variables: Number of variables of each date, see dtw_options.
+    :type variables: int
+    :returns values: Dict with an array of each metric, indexed by \
+    segment label. Metrics that cannot be computed for a segment are NaN.
+    """
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError("Unknown metrics: %s" % ", ".join(sorted(unknown)))
+    warped = {"heterogeneity", "contrast"} & set(metrics)
+    if warped and (l is None or C is None) or ("heterogeneity" in warped
+                                               and img is None):
+        raise ValueError("heterogeneity needs img, l and C, and contrast "
+                         "needs l and C.")
+
+    segmentation = numpy.ascontiguousarray(segmentation)
+    n = max(int(segmentation.max()) + 1, 0)
+    values = {}
+
+    if "size" in metrics or "compactness" in metrics:
+        size = numpy.bincount(segmentation[segmentation >= 0].ravel(),
+                              minlength=n)
+        if "size" in metrics:
+            values["size"] = size
+        if "compactness" in metrics:
+            perimeter = segment_perimeters(segmentation, n)
+            values["compactness"] = (4*numpy.pi*size /
+                                     numpy.maximum(perimeter, 1)**2)
+
+    if "heterogeneity" in metrics or "contrast" in metrics:
+        # Double precision, like the series of the segments
+        weight, opts = warping_options(C[:, :-3].astype(numpy.float64),
+                                       distance_calculation,
+                                       weight_twdtw, dates=dates, alpha=alpha,
+                                       beta=beta, window=window,
+                                       max_step=max_step, penalty=penalty,
+                                       psi=psi, variables=variables)
+
+    if "heterogeneity" in metrics:
+        start, index = label_index(segmentation, n)
+        dispersion = segment_statistics(img, numpy.ascontiguousarray(l),
+                                        start, index, C,
+                                        weight.astype(img.dtype), opts)[1]
+        values["heterogeneity"] = dispersion
+
+    if "contrast" in metrics:
+        series = segment_series(segmentation, l, C)
+        a, b, border = region_adjacency(segmentation, n)
+        dist = edge_distances(series, a, b, weight, opts)
+
+        # Border weighted mean over the neighbours with a series
+        border = numpy.where(numpy.isfinite(dist), border, 0)
+        dist = numpy.where(numpy.isfinite(dist), dist, 0)
+        total = (numpy.bincount(a, border*dist, minlength=n) +
+                 numpy.bincount(b, border*dist, minlength=n))
+        length = (numpy.bincount(a, border, minlength=n) +
+                  numpy.bincount(b, border, minlength=n))
+        contrast = numpy.full(n, numpy.nan)
+        numpy.divide(total, length, out=contrast, where=length > 0)
+        values["contrast"] = contrast
+
+    return values
+
+
+@njit(cache=True)
+def segment_perimeters(segmentation, n):
+    """This function counts the pixel sides on the boundary of each \
+    segment, including the sides on the image border.
+    :param segmentation: Segmentation with labels 0..n-1, negative labels \
+    are ignored.
+    :type segmentation: numpy.ndarray
+    :param n: Number of segments.
+    :type n: int
+    :returns perimeter: Perimeter of each segment.
+    """
+    rows, columns = segmentation.shape
+    perimeter = numpy.zeros(n, dtype=numpy.int64)
+
+    for r in range(rows):
+        for c in range(columns):
+            x = segmentation[r, c]
+            if x < 0:
+                continue
+            if c == 0 or segmentation[r, c-1] != x:
+                perimeter[x] += 1
+            if c + 1 == columns or segmentation[r, c+1] != x:
+                perimeter[x] += 1
+            if r == 0 or segmentation[r-1, c] != x:
+                perimeter[x] += 1
+            if r + 1 == rows or segmentation[r+1, c] != x:
+                perimeter[x] += 1
+
+    return perimeter
@@ -0,0 +1,278 @@
+"""Coarse-to-fine SNITC on spatial and temporal reductions of the SITS."""
+import numpy
+
+from .distance import acquisition_days
+from .grid import grid_hex, grid_regular
+from .segmentation import checkpoint_stage, cluster, seed_clusters
+
+
+def cluster_pyramid(img, ki, m, distance_calculation, weight_twdtw,
+                    factor=4, temporal=1, iter=10, refine=2, width=None,
+                    pattern="hexagonal", dates=None, **kwargs):
+    """This function runs the SNITC iterations on a downsampled image, \
+    and refines the result at full resolution. The coarse labels are \
+    upsampled, the centres are computed from the full resolution pixels \
+    of each label, and only the pixels near the boundaries of the \
+    segments are assigned in the refinement iterations. The pixels away \
+    from the boundaries keep their label, and still update the centres.
+    :param img: Normalized input image with shape (rows, columns, bands), \
+    see pixel_major.
+    :type img: numpy.ndarray
+    :param factor: Downsampling factor of rows and columns.
+    :type factor: int
+    :param temporal: Number of consecutive bands averaged in the coarse \
+    image. Default 1 keeps all bands.
+    :type temporal: int
+    :param iter: Number of iterations on the coarse image.
+    :type iter: int
+    :param refine: Number of iterations at full resolution.
+    :type refine: int
+    :param width: Width in pixels of the band around the boundaries that \
+    is refined. Default is factor.
+    :type width: int
+    :param kwargs: Other parameters of cluster (window, pruning, engine, \
+    stats, callback...), used at both resolutions. Each resolution keeps \
+    its checkpoint in a subdirectory (coarse, refine). A mask of valid \
+    pixels is downsampled for the coarse image, see downsample_mask.
+    :returns: C, S, l, d, k and residuals of the coarse and refinement \
+    iterations, see cluster. Pixels away from the boundaries keep their \
+    distance to the first full resolution centres.
+    """
+    rows, columns, bands = img.shape
+    variables = kwargs.get("variables", 1)
+    if width is None:
+        width = factor
+    mask = kwargs.pop("mask", None)
+    coarse_mask = None
+    if mask is not None:
+        mask = numpy.asarray(mask, dtype=bool)
+        coarse_mask = downsample_mask(mask, factor)
+
+    # Coarse image and acquisition days of its bands
+    coarse = downsample(img, factor, temporal, variables)
+    days = paa(acquisition_days(dates, bands//variables),
+               numpy.arange(0, bands//variables, temporal))
+
+    C, S, l, d, k, residuals = cluster(coarse, ki, m, distance_calculation,
+                                       weight_twdtw, iter=iter,
+                                       pattern=pattern, dates=days,
+                                       mask=coarse_mask,
+                                       **checkpoint_stage(kwargs, "coarse"))
+    coarse = None
+
+    # Labels at full resolution
+    l = l[(numpy.arange(rows)//factor)[:, None],
+          (numpy.arange(columns)//factor)[None, :]]
+    if mask is not None:
+        l[~mask] = -2
+
+    # Spacing of the full resolution grid
+    if pattern == "regular":
+        S = grid_regular(rows, columns, ki)[1]
+    else:
+        S = grid_hex(rows, columns, ki)[1]
+
+    # Centres from the full resolution pixels of each label
+    C_init = numpy.full((k, bands+3), numpy.nan, dtype=img.dtype)
+    C_init[:, bands:bands+2] = C[:, -3:-1]*factor + (factor - 1)/2
+    C_init[:, bands+2] = C[:, -1]
+    C_init, d = seed_clusters(img, C_init, S, l, m, distance_calculation,
+                              weight_twdtw, dates=dates, **kwargs)
+
+    # Pixels away from the boundaries are skipped by the engines
+    outside = ~boundary_band(l, width)
+    if mask is not None:
+        outside &= mask
+    kept = d[outside]
+    d[outside] = -numpy.inf
+
+    C, S, l, d, k, refined = cluster(img, k, m, distance_calculation,
+                                     weight_twdtw, iter=refine,
+                                     init=(C_init, S),
+                                     state=(l, d, numpy.ones(k, dtype=bool)),
+                                     dates=dates, mask=mask,
+                                     **checkpoint_stage(kwargs, "refine"))
+    d[outside] = kept
+
+    return C, S, l, d, k, residuals + refined
+
+
+def downsample(img, factor, temporal=1, variables=1):
+    """This function averages blocks of factor x factor pixels and groups \
+    of consecutive dates. Blocks and groups on the edges can be smaller.
+    :param img: Image with shape (rows, columns, bands).
+    :type img: numpy.ndarray
+    :param factor: Downsampling factor of rows and columns.
+    :type factor: int
+    :param temporal: Number of consecutive dates averaged.
+    :type temporal: int
+    :param variables: Number of variables of each date, see pixel_major.
+    :type variables: int
+    :returns coarse: Image with shape (rows/factor, columns/factor, \
+    bands/temporal), rounded up, and the float type of img.
+    """
+    rows, columns, bands = img.shape
+    shape = (-(-rows//factor), -(-columns//factor))
+
+    total = numpy.zeros(shape + (bands,))
+    count = numpy.zeros(shape + (1,))
+    for i in range(factor):
+        for j in range(factor):
+            part = img[i::factor, j::factor]
+            total[:part.shape[0], :part.shape[1]] += part
+            count[:part.shape[0], :part.shape[1]] += 1
+    total /= count
+
+    if temporal > 1:
+        total = paa(total.reshape(shape + (-1, variables)),
+                    numpy.arange(0, bands//variables, temporal), axis=-2)
+        total = total.reshape(shape + (-1,))
+
+    return numpy.ascontiguousarray(total, dtype=img.dtype)
+
+
+def downsample_mask(mask, factor):
+    """This function downsamples a mask of valid pixels like downsample, \
+    a block is valid if any of its pixels is valid.
+    :param mask: Valid pixels.
+    :type mask: numpy.ndarray
+    :param factor: Downsampling factor of rows and columns.
+    :type factor: int
+    :returns coarse: Valid blocks, with shape (rows/factor, \
+    columns/factor) rounded up.
+    """
+    rows, columns = mask.shape
+    coarse = numpy.zeros((-(-rows//factor), -(-columns//factor)), dtype=bool)
+    for i in range(factor):
+        for j in range(factor):
+            part = mask[i::factor, j::factor]
+            coarse[:part.shape[0], :part.shape[1]] |= part
+
+    return coarse
+
+
+def cluster_paa(img, ki, m, distance_calculation, weight_twdtw, factor=4,
+                period=None, iter=10, final=1, dates=None, **kwargs):
+    """This function runs the first SNITC iterations on a Piecewise \
+    Aggregate Approximation (PAA) of the time series, with the cluster \
+    centres in the same reduced space, and the last iterations on the full \
+    time series. The warping cost grows with the square of the number of \
+    bands, so the reduced iterations are about factor² times cheaper.
+    :param img: Normalized input image with shape (rows, columns, bands), \
+    see pixel_major.
+    :type img: numpy.ndarray
+    :param factor: Number of consecutive bands averaged in each PAA \
+    segment.
+    :type factor: int
+    :param period: If given, bands are averaged in composites of this \
+    number of days instead (date-binned), useful for irregular series.
+    :type period: float
+    :param iter: Total number of iterations.
+    :type iter: int
+    :param final: Number of iterations on the full time series.
+    :type final: int
+    :param kwargs: Other parameters of cluster (pattern, window, pruning, \
+    engine, stats, callback...), used on both representations. Each \
+    representation keeps its checkpoint in a subdirectory (reduced, full).
+    :returns: C, S, l, d, k and residuals of the reduced and full \
+    iterations, see cluster. The residuals of the full iterations have \
+    the fraction of pixels whose label was kept from the reduced \
+    iterations (agreement).
+    """
+    rows, columns, bands = img.shape
+    variables = kwargs.get("variables", 1)
+    days = acquisition_days(dates, bands//variables)
+    groups = temporal_groups(days, factor, period)
+
+    # Every variable is averaged over the same dates
+    reduced = paa(img.reshape(rows, columns, -1, variables), groups, axis=-2)
+    reduced = numpy.ascontiguousarray(reduced.reshape(rows, columns, -1),
+                                      dtype=img.dtype)
+    C, S, l, d, k, residuals = cluster(reduced, ki, m, distance_calculation,
+                                       weight_twdtw, iter=max(iter - final, 1),
+                                       dates=paa(days, groups),
+                                       **checkpoint_stage(kwargs, "reduced"))
+    reduced = None
+    labels = l.copy()
+
+    # Centres over the full time series
+    C_init = numpy.full((k, bands+3), numpy.nan, dtype=img.dtype)
+    C_init[:, bands:] = C[:, -3:]
+    C_init, d = seed_clusters(img, C_init, S, l, m, distance_calculation,
+                              weight_twdtw, dates=dates, **kwargs)
+
+    kwargs.pop("pattern", None)
+    C, S, l, d, k, full = cluster(img, k, m, distance_calculation,
+                                  weight_twdtw, iter=final,
+                                  init=(C_init, S),
+                                  state=(l, d, numpy.ones(k, dtype=bool)),
+                                  dates=dates,
+                                  **checkpoint_stage(kwargs, "full"))
+    if full:
+        full[-1]["agreement"] = float(numpy.mean(l == labels))
+
+    return C, S, l, d, k, residuals + full
+
+
+def temporal_groups(days, factor=4, period=None):
+    """This function splits the bands in groups of consecutive bands.
+    :param days: Elapsed days of each band.
+    :type days: numpy.ndarray
+    :param factor: Number of bands of each group.
+    :type factor: int
+    :param period: If given, the bands acquired in the same period of \
+    this number of days form a group.
+    :type period: float
+    :returns groups: First band of each group.
+    """
+    if period is None:
+        return numpy.arange(0, len(days), factor)
+
+    bins = numpy.floor(days/period)
+    return numpy.flatnonzero(numpy.r_[True, bins[1:] != bins[:-1]])
+
+
+def paa(series, groups, axis=-1):
+    """This function averages groups of consecutive values along an axis \
+    (Piecewise Aggregate Approximation).
+    :param series: Time series, with the bands on the last axis.
+    :type series: numpy.ndarray
+    :param groups: First band of each group, see temporal_groups.
+    :type groups: numpy.ndarray
+    :param axis: Axis of the dates, the last one by default.
+    :type axis: int
+    :returns reduced: Mean of each group, in double precision.
+    """
+    length = numpy.diff(numpy.append(groups, series.shape[axis]))
+    shape = [1]*series.ndim
+    shape[axis] = len(length)
+    return (numpy.add.reduceat(series, groups, axis=axis,
+                               dtype=numpy.double)/length.reshape(shape))
+
+
+def boundary_band(l, width):
+    """This function finds the pixels near the boundaries of the segments.
+    :param l: Matrix label.
+    :type l: numpy.ndarray
+    :param width: Distance in pixels (8-connectivity) from a pixel with a \
+    different neighbour (4-connectivity).
+    :type width: int
+    :returns band: Whether each pixel is near a boundary.
+    """
+    band = numpy.zeros(l.shape, dtype=bool)
+    edge = l[:, 1:] != l[:, :-1]
+    band[:, 1:] |= edge
+    band[:, :-1] |= edge
+    edge = l[1:] != l[:-1]
+    band[1:] |= edge
+    band[:-1] |= edge
+
+    for i in range(width - 1):
+        grown = band.copy()
+        grown[1:] |= band[:-1]
+        grown[:-1] |= band[1:]
+        band = grown.copy()
+        band[:, 1:] |= grown[:, :-1]
+        band[:, :-1] |= grown[:, 1:]
+
+    return band
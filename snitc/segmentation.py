@@ -0,0 +1,1051 @@
+"""SNITC segmentation of a SITS and the clustering iterations."""
+import logging
+import time
+import numpy
+
+from .assign import (assign_clusters, assign_pixels, assign_pruned,
+                     label_distances, update_cluster)
+from .connectivity import postprocessing
+from .distance import acquisition_days, distance_fast, warping_options
+from .export import segment_attributes, write_pandas, write_segments
+from .grid import init_cluster_hex, init_cluster_regular, move_centres
+from .merge import merge_segments
+from .metrics import segment_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def snitc(dataset, ki, m, distance_calculation, weight_twdtw, nodata=0, scale=10000, iter=10, pattern="hexagonal",
+          output="shp", window=None, max_dist=None, max_step=None, 
+          max_diff=None, penalty=None, psi=None, pruning=False, dates=None,
+          alpha=None, beta=None, engine="parallel", tol=None, dtype="float64",
+          callback=None, return_stats=False, dst_path=None, mask=None,
+          checkpoint=None, resume=False, merge_threshold=None,
+          merge_target=None, metrics=("size", "compactness"), variables=1):
+    """This function create spatial-temporal superpixels using a Satellite \
+    Image Time Series (SITS). Version 1.4
+    :param image: SITS dataset. A xarray.DataArray can have the \
+    dimensions (time, variable, y, x) of a multivariate SITS.
+    :type image: Rasterio dataset object or a xarray.DataArray.
+    :param k: Number or desired superpixels. (Qual o número de superpixels \
+    desejados?)
+    :type k: int
+    :param m: Compactness value. Bigger values led to regular superpixels. \
+    não podendo ser 0
+    :type m: int
+    :param nodata: If you dataset contain nodata, it will be replace by \
+    this value. This value is necessary to be possible the use the \
+    DTW distance. Ideally your dataset must not contain nodata. (Quantidade \
+    de valores NoData (valores nulos))
+    :type nodata: float
+    :param scale: Adjust the time series, to 0-1. Necessary to distance \
+    calculation. A sequence gives the scale of each variable.
+    :type scale: int or list
+    :param iter: Number of iterations to be performed. Default = 10.
+    :type iter: int
+    :param pattern: Type of pattern initialization. Hexagonal (default) or\
+    regular (as SLIC).
+    :type pattern: int
+    :param output: Type of output to be produced. Default is shp (Shapefile).\
+    The two possible values are shp and matrix (returns a numpy array).
+    :type output: string
+    :param window: Only allow for maximal shifts from the two diagonals \
+    smaller than this number. It includes the diagonal, meaning that an \
+    Euclidean distance is obtained by setting window=1.
+    :param max_dist: Stop if the returned values will be larger than \
+    this value.
+    :param max_step: Do not allow steps larger than this value.
+    :param max_diff: Return infinity if length of two series is larger.
+    :param penalty: Penalty to add if compression or expansion is applied.
+    :param psi: Psi relaxation parameter (ignore start and end of matching). \
+    Useful for cyclical series.
+    :param dates: Acquisition dates of the bands, used by TWDTW. If None, \
+    they are read from the time coordinate of a xarray.DataArray or the \
+    bands are assumed evenly spaced over one year.
+    :type dates: list of numpy.datetime64 or days
+    :param alpha: Steepness (logistic) or slope (linear) of the TWDTW \
+    temporal weight. Default -0.1 (logistic) or 1/365 (linear).
+    :type alpha: float
+    :param beta: Midpoint (logistic) or offset (linear) of the TWDTW \
+    temporal weight. Default 100 (logistic) or 0 (linear).
+    :type beta: float
+    :param pruning: Skip the DTW/TWDTW of pixels that cannot change label, \
+    using lower bounds (LB_Kim, LB_Keogh) plus the spatial distance \
+    against the current pixel distance, and early abandon.
+    :type pruning: bool
+    :param engine: Assignment engine. parallel (default) processes the \
+    clusters on all cores with the Numba kernels, giving the same result \
+    as the serial order. pixel compares each pixel only with the clusters \
+    whose window covers it, in one parallel sweep over the image. serial \
+    runs one cluster after another with dtaidistance.
+    :type engine: string
+    :param tol: Stop before iter iterations when the fraction of pixels \
+    that changed label is not larger than this value. The iterations \
+    always stop when no cluster centre moved.
+    :type tol: float
+    :param dtype: Precision of the image, cluster centres and distances, \
+    float64 (default) or float32. float32 halves the memory of the largest \
+    arrays. Labels are always int32.
+    :type dtype: string
+    :param callback: Function called as callback(stage, info) after each \
+    stage (read, normalize, init, assign, update, iteration, \
+    postprocessing, vectorize), with a dict of the wall time (seconds), \
+    pixels processed and other information of the stage.
+    :type callback: function
+    :param return_stats: Also return the stats of the run, see new_stats.
+    :type return_stats: bool
+    :param dst_path: If given, the segments are written in chunks to this \
+    GeoPackage (.gpkg), FlatGeobuf (.fgb) or GeoParquet (.parquet) file \
+    with their attributes (see segment_attributes), and the path is \
+    returned instead of the segmentation.
+    :type dst_path: string
+    :param mask: Pixels left out of the segmentation. nodata masks the \
+    pixels whose time series is entirely nodata (the dataset mask of a \
+    Rasterio dataset, NaN in a xarray.DataArray), or a boolean array with \
+    the shape of the image gives the valid pixels. Only the window that \
+    contains the valid pixels is read and clustered (memory still grows \
+    with the window, not with the valid pixels), centres on masked pixels \
+    move to the nearest valid pixel of their cell, masked pixels are never \
+    compared with the clusters, and they get label -1, that is dropped \
+    from the vector output. Default None clusters every pixel.
+    :type mask: string or numpy.ndarray
+    :param checkpoint: Directory where the clustering state is saved \
+    after each iteration, see cluster.
+    :type checkpoint: string
+    :param resume: Continue the clustering from the last iteration saved \
+    in checkpoint.
+    :type resume: bool
+    :param merge_threshold: Adjacent segments whose DTW/TWDTW distance is \
+    not larger than this value are merged after postprocessing, the \
+    closest first, see merge_segments.
+    :type merge_threshold: float
+    :param merge_target: Number of segments where merging stops.
+    :type merge_target: int
+    :param metrics: Quality metrics of the segments (size, heterogeneity, \
+    contrast, compactness) whose mean is reported in the stats, see \
+    segment_metrics. heterogeneity and contrast compute warping distances.
+    :type metrics: tuple
+    :param variables: Number of variables of a Rasterio dataset whose \
+    bands are the time series of each variable one after another (all \
+    dates of the first variable, then of the second...). The dates of all \
+    variables are warped together (dependent DTW/TWDTW). It is read from \
+    the variable dimension of a xarray.DataArray.
+    :type variables: int
+
+    :returns segmentation: Segmentation produced.
+    :returns stats: Wall time, calls and pixels of each stage, number of \
+    warping distances computed and pruned, residuals of each iteration \
+    and metrics of the segmentation. Only if return_stats is True.
+    ..Note::
+        Reference: Soares, A. R., Körting, T. S., Fonseca, L. M. G., Bendini, \
+        H. N. `Simple Nonlinear Iterative Temporal Clustering. \
+        <https://ieeexplore.ieee.org/document/9258957>`_ \
+        IEEE Transactions on Geoscience and Remote, 2020 (Early Access).
+    """
+    import rasterio
+    import xarray
+    from rasterio.transform import Affine
+    from rasterio.windows import Window
+
+    logger.info('Simple Non-Linear Iterative Temporal Clustering V 1.4')
+    stats = new_stats()
+
+    check_dtype(dtype)
+
+    valid = None
+    if isinstance(mask, str):
+        if mask != "nodata":
+            raise ValueError("Unknown mask %s, use nodata or an array of "
+                             "valid pixels." % mask)
+    elif mask is not None:
+        valid = numpy.asarray(mask, dtype=bool)
+
+    start = time.perf_counter()
+    if isinstance(dataset, rasterio.io.DatasetReader):
+        shape = (dataset.height, dataset.width)
+        if isinstance(mask, str):
+            valid = dataset.dataset_mask() > 0
+        if valid is not None:
+            rs, cs = valid_window(valid)
+            valid = valid[rs, cs]
+        try:
+            # READ FILE
+            meta = dataset.profile  # get image metadata
+            transform = meta["transform"]
+            crs = meta["crs"]
+            if valid is not None:
+                # Only the window of valid pixels is read
+                img = read_pixels(dataset, Window.from_slices(rs, cs),
+                                  dtype=dtype, variables=variables)
+            else:
+                img = read_pixels(dataset, dtype=dtype, variables=variables)
+
+        except:
+            Exception('Sorry we could not read your dataset.')
+    elif isinstance(dataset, xarray.DataArray):
+        # numpy or dask array, dask arrays are computed chunk by chunk
+        values = dataset.data
+        shape = values.shape[-2:]
+        if values.ndim == 4:
+            # Multivariate SITS (time, variable, y, x)
+            variables = values.shape[1]
+        if isinstance(mask, str):
+            valid = numpy.asarray(~numpy.isnan(values).all(
+                axis=tuple(range(values.ndim - 2))))
+        if valid is not None:
+            rs, cs = valid_window(valid)
+            valid = valid[rs, cs]
+            values = values[..., rs, cs]
+        try:
+            # READ FILE
+            transform, crs = georeference(dataset)
+            img = pixel_major(values, dtype=dtype)
+            values = None
+            times = dataset.coords[dataset.dims[0]].values
+            if dates is None and numpy.issubdtype(times.dtype,
+                                                  numpy.datetime64):
+                dates = times
+
+        except:
+            Exception('Sorry we could not read your dataset.')
+    else:
+        TypeError("Sorry we can't read this type of file. \
+                  Please use Rasterio or xarray")
+
+    pixels = img.shape[0]*img.shape[1]
+    record(stats, "read", time.perf_counter() - start, pixels, callback)
+
+    # Normalize data
+    start = time.perf_counter()
+    img = normalize(img, nodata, scale)
+    record(stats, "normalize", time.perf_counter() - start, pixels, callback)
+
+    C, S, l, d, k, residuals = cluster(img, ki, m, distance_calculation,
+                                       weight_twdtw, iter=iter,
+                                       pattern=pattern, window=window,
+                                       max_dist=max_dist, max_step=max_step,
+                                       max_diff=max_diff, penalty=penalty,
+                                       psi=psi, pruning=pruning, dates=dates,
+                                       alpha=alpha, beta=beta, engine=engine,
+                                       tol=tol, stats=stats,
+                                       callback=callback, mask=valid,
+                                       checkpoint=checkpoint, resume=resume,
+                                       variables=variables)
+
+    # Remove noise from segmentation, masked pixels have label -2
+    start = time.perf_counter()
+    labelled = postprocessing(l, S, nodata=-2)
+    record(stats, "postprocessing", time.perf_counter() - start, pixels,
+           callback)
+
+    if merge_threshold is not None or merge_target is not None:
+        # Merge adjacent segments with similar time series
+        start = time.perf_counter()
+        labelled = merge_segments(labelled, l, C, merge_threshold,
+                                  merge_target, distance_calculation,
+                                  weight_twdtw, dates=dates, alpha=alpha,
+                                  beta=beta, window=window,
+                                  max_step=max_step, penalty=penalty,
+                                  psi=psi, variables=variables)
+        record(stats, "merge", time.perf_counter() - start, pixels,
+               callback, segments=int(labelled.max()) + 1)
+
+    if valid is not None:
+        # Segmentation of the whole image, with -1 outside the window
+        full = numpy.full(shape, -1, dtype=labelled.dtype)
+        full[rs, cs] = labelled
+    else:
+        full = labelled
+
+    # Metrics for validation
+    start = time.perf_counter()
+    values = segment_metrics(labelled, img, l, C, metrics or (),
+                             distance_calculation, weight_twdtw, dates=dates,
+                             alpha=alpha, beta=beta, window=window,
+                             max_step=max_step, penalty=penalty, psi=psi,
+                             variables=variables)
+    summary = {"segments": int(labelled.max()) + 1}
+    for name, value in values.items():
+        summary[name] = float(numpy.nanmean(value)) if len(value) else 0.0
+    record(stats, "metrics", time.perf_counter() - start, pixels, callback)
+    logger.info("Segmentation metrics %s", summary)
+    stats["metrics"] = summary
+
+    if dst_path is not None:
+        start = time.perf_counter()
+        attributes = segment_attributes(labelled, img, l, C,
+                                        distance_calculation, weight_twdtw,
+                                        dates=dates, alpha=alpha, beta=beta,
+                                        window=window, max_step=max_step,
+                                        penalty=penalty, psi=psi,
+                                        variables=variables)
+        if valid is not None:
+            # Transform of the window of valid pixels
+            transform = (Affine(*tuple(transform)[:6]) *
+                         Affine.translation(cs.start, rs.start))
+        segmentation = write_segments(labelled, dst_path, transform, crs,
+                                      attributes)
+        record(stats, "vectorize", time.perf_counter() - start, pixels,
+               callback, segments=len(attributes))
+    elif output == "shp":
+        start = time.perf_counter()
+        segmentation = write_pandas(full, transform, crs)
+        record(stats, "vectorize", time.perf_counter() - start, pixels,
+               callback, segments=len(segmentation))
+    else:
+        # Return labeled numpy.array for visualization on python
+        segmentation = full
+
+    if return_stats:
+        return segmentation, stats
+    return segmentation
+
+
+def normalize(img, nodata=0, scale=10000):
+    """This function replaces nodata and adjusts the time series to 0-1, \
+    in place.
+    :param img: Input image.
+    :type img: numpy.ndarray
+    :param nodata: Value used to replace nodata (NaN).
+    :type nodata: float
+    :param scale: Adjust the time series, to 0-1. A sequence gives the \
+    scale of each variable of a multivariate image (date major bands, see \
+    pixel_major).
+    :type scale: int or list
+    :returns img: Normalized image.
+    """
+    img[numpy.isnan(img)] = nodata
+    if numpy.ndim(scale):
+        scale = numpy.asarray(scale, dtype=img.dtype)
+        scale = numpy.tile(scale, img.shape[-1]//scale.size)
+    img /= scale
+
+    return img
+
+
+def pixel_major(img, dtype="float64"):
+    """This function converts an image with shape (bands, rows, columns) \
+    to a C-contiguous float array with shape (rows, columns, bands), where \
+    the time series of each pixel is contiguous in memory. A multivariate \
+    image with shape (dates, variables, rows, columns) gets date major \
+    bands: the variables of the first date, then of the second... A dask \
+    array is computed chunk by chunk into the output, without a copy of \
+    the whole image in the original layout.
+    :param img: Input image.
+    :type img: numpy.ndarray or dask.array.Array
+    :param dtype: Float type of the output, float64 or float32.
+    :type dtype: string
+    :returns img: Image with shape (rows, columns, bands).
+    """
+    # Rows and columns first
+    axes = (img.ndim - 2, img.ndim - 1) + tuple(range(img.ndim - 2))
+    rows, columns = img.shape[-2:]
+
+    if hasattr(img, "dask"):
+        out = numpy.empty((rows, columns) + img.shape[:-2], dtype=dtype)
+        img.transpose(axes).astype(dtype).store(out, lock=False)
+        return out.reshape(rows, columns, -1)
+
+    img = numpy.ascontiguousarray(img.transpose(axes), dtype=dtype)
+    return img.reshape(rows, columns, -1)
+
+
+def georeference(dataset):
+    """This function gets the transform and crs of a xarray.DataArray, \
+    from its attributes (xarray.open_rasterio) or from the rio accessor of \
+    rioxarray.
+    :param dataset: SITS dataset.
+    :type dataset: xarray.DataArray
+    :returns transform: Transformation parameters.
+    :returns crs: Coordinate Reference System.
+    """
+    if "transform" in dataset.attrs:
+        return dataset.attrs["transform"], dataset.attrs.get("crs")
+
+    return dataset.rio.transform(), dataset.rio.crs
+
+
+def read_pixels(dataset, window=None, dtype="float64", variables=1):
+    """This function reads a rasterio dataset band by band into an image \
+    with shape (rows, columns, bands), with nodata as NaN.
+    :param dataset: SITS dataset.
+    :type dataset: Rasterio dataset object
+    :param window: Window to be read. Default is the whole dataset.
+    :type window: rasterio.windows.Window
+    :param dtype: Float type of the output, float64 or float32.
+    :type dtype: string
+    :param variables: Number of variables, whose time series are one after \
+    another in the dataset. The bands of the image are date major, see \
+    pixel_major.
+    :type variables: int
+    :returns img: Image with shape (rows, columns, bands).
+    """
+    if window is None:
+        shape = (dataset.height, dataset.width)
+    else:
+        shape = (int(window.height), int(window.width))
+
+    img = numpy.empty(shape + (dataset.count,), dtype=dtype)
+    times = dataset.count//variables
+    for band in range(dataset.count):
+        v, t = divmod(band, times)
+        img[:, :, t*variables + v] = dataset.read(band+1, window=window)
+
+    if dataset.nodata is not None:
+        img[img == dataset.nodata] = numpy.nan
+
+    return img
+
+
+def valid_window(valid):
+    """This function finds the smallest window that contains all the \
+    valid pixels of a mask.
+    :param valid: Valid pixels.
+    :type valid: numpy.ndarray
+    :returns rows: Slice of the rows of the window.
+    :returns columns: Slice of the columns of the window.
+    """
+    rows = numpy.flatnonzero(valid.any(axis=1))
+    columns = numpy.flatnonzero(valid.any(axis=0))
+    if len(rows) == 0:
+        raise ValueError("The mask has no valid pixels.")
+
+    return (slice(int(rows[0]), int(rows[-1]) + 1),
+            slice(int(columns[0]), int(columns[-1]) + 1))
+
+
+def cluster(img, ki, m, distance_calculation, weight_twdtw, iter=10,
+            pattern="hexagonal", window=None, max_dist=None, max_step=None,
+            max_diff=None, penalty=None, psi=None, pruning=False, dates=None,
+            alpha=None, beta=None, engine="parallel", init=None, tol=None,
+            stats=None, callback=None, mask=None, state=None,
+            checkpoint=None, resume=False, variables=1):
+    """This function runs the SNITC iterations on a normalized image. The \
+    parameters are the same of snitc. Only clusters whose centre moved in \
+    the previous iteration are assigned again: the distance of a pixel \
+    never increases, so an unchanged cluster cannot take any pixel. The \
+    cluster centres and distances have the float type of img, and the \
+    labels are int32.
+    :param img: Normalized input image with shape (rows, columns, bands), \
+    see pixel_major. It can be a numpy.memmap.
+    :type img: numpy.ndarray
+    :param init: Cluster centres and spacing (C, S) used instead of the \
+    pattern initialization.
+    :type init: tuple
+    :param stats: Stats updated in place with the init, assign and update \
+    stages and the residuals of each iteration, see new_stats.
+    :type stats: dict
+    :param callback: Function called as callback(stage, info) after each \
+    stage and iteration, see snitc.
+    :type callback: function
+    :param mask: Valid pixels. Masked pixels get label -2 and distance \
+    -inf, so the Numba engines never compute their distances and \
+    update_cluster ignores them. Without state, centres on masked pixels \
+    move to the nearest valid pixel of their cell, see move_centres, and \
+    ValueError is raised if none is left.
+    :type mask: numpy.ndarray
+    :param state: Matrix label, distance matrix and clusters to be \
+    assigned in the first iteration (l, d, active), used with init \
+    instead of unlabelled pixels, see recluster.
+    :type state: tuple
+    :param checkpoint: Directory where the label and distance matrices are \
+    kept as memory-mapped files (l.npy, d.npy), and where C and the \
+    iteration are saved after each iteration (state.npz).
+    :type checkpoint: string
+    :param resume: Continue from the last iteration saved in checkpoint, \
+    if any, instead of starting again. A checkpoint written for another \
+    image shape or other parameters raises ValueError, see \
+    checkpoint_fingerprint.
+    :type resume: bool
+    :param variables: Number of variables of each date of a multivariate \
+    image with date major bands (see pixel_major). The centres hold the \
+    mean series of every variable, and the distances are dependent \
+    DTW/TWDTW over all variables.
+    :type variables: int
+    :returns C: ND-array containing cluster centres information.
+    :returns S: Spacing between clusters.
+    :returns l: Matrix label.
+    :returns d: Distance matrix from cluster centres.
+    :returns k: Number of superpixels.
+    :returns residuals: List with a dict per iteration: fraction of pixels \
+    that changed label (relabelled), mean displacement of the centres in \
+    pixels (shift), mean RMS change of the centre series (series), \
+    number of clusters assigned (clusters) and number of warping \
+    distances computed (evaluated) and pruned (pruned).
+    """
+    # Get image dimensions
+    rows = img.shape[0]
+    columns = img.shape[1]
+    bands = img.shape[2]
+    pixels = rows*columns
+
+    if stats is None:
+        stats = new_stats()
+
+    if distance_calculation not in ("dtw", "twdtw"):
+        raise ValueError("Choose a spatio-temporal distance calculation "
+                         "method (dtw or twdtw)")
+
+    check_dtype(img.dtype)
+
+    if engine not in ("parallel", "pixel", "serial"):
+        raise ValueError("Unknown engine %s, use parallel, pixel or "
+                         "serial." % engine)
+
+    if bands % variables:
+        raise ValueError("The number of bands must be a multiple of the "
+                         "number of variables.")
+
+    # Elapsed days between acquisitions for the TWDTW temporal weight
+    days = acquisition_days(dates, bands//variables)
+
+    if pruning or engine in ("parallel", "pixel"):
+        weight, opts = warping_options(img, distance_calculation,
+                                       weight_twdtw, dates=dates, alpha=alpha,
+                                       beta=beta, window=window,
+                                       max_dist=max_dist, max_step=max_step,
+                                       penalty=penalty, psi=psi,
+                                       variables=variables)
+
+    start = time.perf_counter()
+    resumed = None
+    fingerprint = None
+    if checkpoint is not None:
+        # Image and parameters of the run, checked on resume
+        fingerprint = checkpoint_fingerprint(
+            img, ki=ki, m=m, distance_calculation=distance_calculation,
+            weight_twdtw=weight_twdtw, pattern=pattern, window=window,
+            max_dist=max_dist, max_step=max_step, max_diff=max_diff,
+            penalty=penalty, psi=psi, days=days, alpha=alpha, beta=beta,
+            variables=variables, mask=mask,
+            init=None if init is None else init[0],
+            labels=None if state is None else state[0],
+            distances=None if state is None else state[1])
+        if resume:
+            resumed = load_checkpoint(checkpoint)
+
+    if resumed is not None:
+        C, S, l, d, active, first, residuals, converged, saved = resumed
+        k = C.shape[0]
+        if saved != fingerprint:
+            raise ValueError("The checkpoint was written for another image "
+                             "or other parameters.")
+        if mask is not None:
+            pixels = int(numpy.asarray(mask).sum())
+        stats["iterations"].extend(residuals)
+        logger.info("Resuming from iteration %d", first)
+    else:
+        if init is not None:
+            C, S = init
+            k = C.shape[0]
+            C = C.astype(img.dtype)
+            if state is not None:
+                l, d = state[:2]
+            else:
+                l = numpy.full((rows, columns), -1, dtype=numpy.int32)
+                d = numpy.full((rows, columns), numpy.inf, dtype=img.dtype)
+        elif pattern == "hexagonal":
+            C, S, l, d, k = init_cluster_hex(rows, columns, ki, img, bands)
+        elif pattern == "regular":
+            C, S, l, d, k = init_cluster_regular(rows, columns, ki, img,
+                                                 bands)
+        else:
+            logger.warning("Unknow patter. We are using hexagonal")
+            C, S , l, d, k = init_cluster_hex(rows, columns, ki, img, bands)
+
+        if mask is not None:
+            mask = numpy.asarray(mask, dtype=bool)
+            if state is None:
+                # Centres on masked pixels move to a valid pixel of their
+                # cell, centres given with labels are kept
+                C = C[move_centres(C, img, mask, S, bands)]
+                k = C.shape[0]
+            if k == 0:
+                raise ValueError("No cluster centre has a valid pixel in "
+                                 "its cell, use a larger ki.")
+            l[~mask] = -2
+            d[~mask] = -numpy.inf
+            pixels = int(mask.sum())
+
+        # Clusters whose centre moved in the previous iteration
+        if state is not None:
+            active = numpy.asarray(state[2], dtype=bool)
+        else:
+            active = numpy.ones(k, dtype=bool)
+        residuals = []
+        first = 0
+        converged = False
+
+        if checkpoint is not None:
+            # Label and distance matrices in memory-mapped files
+            l, d = checkpoint_arrays(checkpoint, l, d)
+    record(stats, "init", time.perf_counter() - start, pixels, callback,
+           clusters=k)
+
+    if engine == "serial":
+        # Work array reused by the dtaidistance call of every window
+        buffer = numpy.empty(((2*S+2)**2 + 1, bands))
+
+    # Start clustering
+    for n in range(first, first if converged else iter):
+        previous = l.copy()
+        start = time.perf_counter()
+
+        if engine == "parallel":
+            # Process non-overlapping windows at the same time
+            count = assign_clusters(img, C, S, m, k, d, l, weight, opts,
+                                    pruning, active).sum(axis=0)
+        elif engine == "pixel":
+            # Compare each pixel with the clusters that cover it
+            count = assign_pixels(img, C, S, m, k, d, l, weight, opts,
+                                  pruning, active).sum(axis=0)
+        else:
+            count = numpy.zeros(2, dtype=numpy.int64)
+            for kk in range(k):
+                if not active[kk]:
+                    continue
+
+                # Get subimage around cluster
+                rmin = int(numpy.floor(max(C[kk, bands]-S, 0)))
+                rmax = int(numpy.floor(min(C[kk, bands]+S, rows))+1)
+                cmin = int(numpy.floor(max(C[kk, bands+1]-S, 0)))
+                cmax = int(numpy.floor(min(C[kk, bands+1]+S, columns))+1)
+
+                # Create subimage view
+                subim = img[rmin:rmax, cmin:cmax]
+
+                # get cluster centres
+                # Average time series
+                c_series = C[kk, :bands]
+
+                # X-coordinate
+                ic = int(numpy.floor(C[kk, bands])) - rmin
+                # Y-coordinate
+                jc = int(numpy.floor(C[kk, bands+1])) - cmin
+
+                if pruning:
+                    # Only pixels that can change label are compared
+                    assign_pruned(img, c_series, ic + rmin,
+                                  jc + cmin, rmin, rmax, cmin, cmax, S, m,
+                                  kk, d, l, weight, opts, count)
+                    continue
+
+                # Masked pixels are never compared
+                subd = d[rmin:rmax, cmin:cmax]
+                valid = subd != -numpy.inf
+                compared = int(valid.sum())
+                if compared == 0:
+                    continue
+                if compared == valid.size:
+                    valid = None
+                count[0] += compared
+
+                # Calculate Spatio-temporal distance
+                D = distance_fast(c_series, ic, jc, subim, S, m, rmin, cmin,
+                                  distance_calculation, weight_twdtw,
+                                  window=window, max_dist=max_dist,
+                                  max_step=max_step, max_diff=max_diff,
+                                  penalty=penalty, psi=psi, dates=days,
+                                  alpha=alpha, beta=beta, buffer=buffer,
+                                  variables=variables, valid=valid)
+
+                # Same precision as the distance matrix
+                D = D.astype(d.dtype, copy=False)
+                subl = l[rmin:rmax, cmin:cmax]
+
+                # Check if Distance from new cluster is smaller than previous
+                subl = numpy.where(D < subd, kk, subl)
+                subd = numpy.where(D < subd, D, subd)
+
+                # Replace the pixels that had smaller difference
+                d[rmin:rmax, cmin:cmax] = subd
+                l[rmin:rmax, cmin:cmax] = subl
+
+        evaluated = int(count[0])
+        pruned = int(count[1])
+        stats["distances"]["evaluated"] += evaluated
+        stats["distances"]["pruned"] += pruned
+        record(stats, "assign", time.perf_counter() - start, pixels,
+               callback, iteration=n + 1, clusters=int(active.sum()),
+               evaluated=evaluated, pruned=pruned)
+
+        # Update Clusters
+        start = time.perf_counter()
+        C_new = update_cluster(img, l, rows, columns, bands, k, C)
+        record(stats, "update", time.perf_counter() - start, pixels,
+               callback, iteration=n + 1)
+
+        # Convergence
+        residual = cluster_residuals(C, C_new, bands)
+        residual["iteration"] = n + 1
+        residual["relabelled"] = float(numpy.mean(l != previous))
+        residual["clusters"] = int(active.sum())
+        residual["evaluated"] = evaluated
+        residual["pruned"] = pruned
+        active = residual.pop("moved")
+        residuals.append(residual)
+        stats["iterations"].append(residual)
+        logger.info("Iteration %d: %d clusters, %.4f relabelled, centre "
+                    "shift %.4f, series change %.4f, %d distances, %d "
+                    "pruned", n + 1, residual["clusters"],
+                    residual["relabelled"], residual["shift"],
+                    residual["series"], evaluated, pruned)
+        if callback is not None:
+            callback("iteration", dict(residual))
+
+        C = C_new
+        converged = (not active.any() or
+                     (tol is not None and residual["relabelled"] <= tol))
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, C, S, l, d, active, n + 1,
+                            residuals, converged, fingerprint)
+        if converged:
+            break
+
+    return C, S, l, d, k, residuals
+
+
+def recluster(img, state, m, distance_calculation, weight_twdtw, iter=2,
+              change=None, **kwargs):
+    """This function updates a previous segmentation after new \
+    acquisitions are appended to the stack. The centres are seeded with \
+    the mean of the previous segments over the extended time series, the \
+    distance of each pixel to its cluster is computed once, and a few \
+    iterations refine the labels. With change, only clusters whose new \
+    observations differ from their mean are assigned in the first \
+    iteration, and then only clusters whose centre moved.
+    :param img: Normalized extended image with shape (rows, columns, \
+    bands), where the first bands are the bands of the previous run.
+    :type img: numpy.ndarray
+    :param state: C, S and l (and d, that is recomputed) of the previous \
+    run, as returned by cluster.
+    :type state: tuple
+    :param m: Compactness value.
+    :type m: int
+    :param distance_calculation: dtw or twdtw, see snitc.
+    :type distance_calculation: string
+    :param weight_twdtw: Type of TWDTW weight, logistic or linear.
+    :type weight_twdtw: string
+    :param iter: Number of refinement iterations. Default = 2.
+    :type iter: int
+    :param change: Smallest mean RMS difference between the new \
+    observations of the pixels of a cluster and their mean for the \
+    cluster to be assigned again. Default None assigns all clusters.
+    :type change: float
+    :param kwargs: Other parameters of cluster (dates, window, pruning, \
+    engine, stats...).
+    :returns: C, S, l, d, k and residuals, see cluster.
+    """
+    C, S, l = state[:3]
+    rows, columns, bands = img.shape
+    k = C.shape[0]
+    previous = C.shape[1] - 3
+    if bands < previous:
+        raise ValueError("The extended stack has fewer bands than the "
+                         "previous run.")
+
+    # Centres of the previous run over the extended time series, clusters
+    # without pixels keep NaN in the new bands
+    l = numpy.array(l, dtype=numpy.int32)
+    C_init = numpy.full((k, bands+3), numpy.nan, dtype=img.dtype)
+    C_init[:, :previous] = C[:, :previous]
+    C_init[:, bands:] = C[:, previous:]
+    C_init, d = seed_clusters(img, C_init, S, l, m, distance_calculation,
+                              weight_twdtw, **kwargs)
+
+    active = numpy.ones(k, dtype=bool)
+    if change is not None and bands > previous:
+        # Mean RMS difference between the new observations of the pixels
+        # of each cluster and their mean
+        labelled = l >= 0
+        la = l[labelled]
+        diff = img[:, :, previous:][labelled] - C_init[la, previous:bands]
+        rms = numpy.sqrt(numpy.mean(diff**2, axis=1))
+        total = numpy.bincount(la, weights=rms, minlength=k)
+        active = total > change*numpy.bincount(la, minlength=k)
+        logger.info("Reclustering %d of %d clusters", int(active.sum()), k)
+
+    return cluster(img, k, m, distance_calculation, weight_twdtw, iter=iter,
+                   init=(C_init, S), state=(l, d, active), **kwargs)
+
+
+def seed_clusters(img, C, S, l, m, distance_calculation, weight_twdtw,
+                  **kwargs):
+    """This function computes the cluster centres of a segmentation and \
+    the distance of each pixel to the cluster of its label, to start the \
+    iterations from labels given at another resolution or time series \
+    length.
+    :param img: Normalized image with shape (rows, columns, bands).
+    :type img: numpy.ndarray
+    :param C: ND-array with bands+3 columns, kept for clusters without \
+    pixels.
+    :type C: numpy.ndarray
+    :param S: Spacing between clusters.
+    :type S: int
+    :param l: Matrix label of the pixels of img.
+    :type l: numpy.ndarray
+    :param m: Compactness value.
+    :type m: int
+    :param kwargs: Other parameters of cluster, see warping_options.
+    :returns C: ND-array containing cluster centres information.
+    :returns d: Distance matrix from cluster centres.
+    """
+    rows, columns, bands = img.shape
+    C = update_cluster(img, l, rows, columns, bands, C.shape[0], C)
+
+    weight, opts = warping_options(img, distance_calculation, weight_twdtw,
+                                   **kwargs)
+    d = label_distances(img, C, S, m, l, weight, opts)
+
+    return C, d
+
+
+def checkpoint_fingerprint(img, **params):
+    """This function describes the image and the parameters of a run, \
+    saved in the checkpoint so that a resume with another image shape or \
+    other parameters is detected. Arrays are described by their SHA-1 \
+    digest.
+    :param img: Normalized image with shape (rows, columns, bands).
+    :type img: numpy.ndarray
+    :param params: Parameters of cluster that change the result.
+    :returns fingerprint: JSON string.
+    """
+    import hashlib
+    import json
+
+    values = {"shape": list(img.shape), "dtype": str(img.dtype)}
+    for key, value in params.items():
+        if value is not None and numpy.ndim(value):
+            value = hashlib.sha1(
+                numpy.ascontiguousarray(value).tobytes()).hexdigest()
+        values[key] = value
+
+    return json.dumps(values, sort_keys=True, default=str)
+
+
+def checkpoint_stage(kwargs, name):
+    """This function gives a stage of a run (a resolution, a tile...) its \
+    own subdirectory of the checkpoint, so that the stages calling cluster \
+    on the same checkpoint do not resume the state of each other.
+    :param kwargs: Parameters of cluster.
+    :type kwargs: dict
+    :param name: Name of the stage.
+    :type name: string
+    :returns kwargs: Parameters with the checkpoint of the stage, kwargs \
+    itself without checkpoint.
+    """
+    import os
+
+    if kwargs.get("checkpoint") is None:
+        return kwargs
+    return dict(kwargs, checkpoint=os.path.join(kwargs["checkpoint"], name))
+
+
+def checkpoint_arrays(checkpoint, l, d):
+    """This function copies the label and distance matrices to \
+    memory-mapped files of a checkpoint directory.
+    :param checkpoint: Checkpoint directory, created if needed.
+    :type checkpoint: string
+    :param l: Matrix label.
+    :type l: numpy.ndarray
+    :param d: Distance matrix.
+    :type d: numpy.ndarray
+    :returns l: Matrix label in l.npy.
+    :returns d: Distance matrix in d.npy.
+    """
+    import os
+    from numpy.lib.format import open_memmap
+
+    os.makedirs(checkpoint, exist_ok=True)
+
+    # An older state does not match the new matrices
+    for name in os.listdir(checkpoint):
+        if name == "state.npz" or name.startswith(("l-", "d-")):
+            os.remove(os.path.join(checkpoint, name))
+
+    arrays = []
+    for name, array in (("l", l), ("d", d)):
+        mapped = open_memmap(os.path.join(checkpoint, name + ".npy"),
+                             mode="w+", dtype=array.dtype, shape=array.shape)
+        mapped[:] = array
+        arrays.append(mapped)
+
+    return arrays
+
+
+def save_checkpoint(checkpoint, C, S, l, d, active, iteration, residuals,
+                    converged, fingerprint=None):
+    """This function saves the state of the clustering after an \
+    iteration. The memory-mapped matrices are changed in place by the next \
+    iteration, so a copy of them is saved with the iteration number \
+    (l-<iteration>.npy, d-<iteration>.npy). Every file is written to a \
+    temporary file and renamed, state.npz last, so an interrupted run \
+    always leaves the complete state of a completed iteration.
+    :param checkpoint: Checkpoint directory, see checkpoint_arrays.
+    :type checkpoint: string
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :param S: Spacing between clusters.
+    :type S: int
+    :param l: Memory-mapped matrix label, flushed to disk.
+    :type l: numpy.memmap
+    :param d: Memory-mapped distance matrix, flushed to disk.
+    :type d: numpy.memmap
+    :param active: Clusters to be assigned in the next iteration.
+    :type active: numpy.ndarray
+    :param iteration: Number of completed iterations.
+    :type iteration: int
+    :param residuals: Residuals of the completed iterations.
+    :type residuals: list
+    :param converged: Whether the iterations stopped early.
+    :type converged: bool
+    :param fingerprint: Image and parameters of the run, see \
+    checkpoint_fingerprint.
+    :type fingerprint: string
+    """
+    import json
+    import os
+
+    l.flush()
+    d.flush()
+
+    for name, array in (("l", l), ("d", d)):
+        tmp = os.path.join(checkpoint, name + ".tmp.npy")
+        numpy.save(tmp, array)
+        os.replace(tmp, os.path.join(checkpoint,
+                                     "%s-%d.npy" % (name, iteration)))
+
+    path = os.path.join(checkpoint, "state.npz")
+    tmp = os.path.join(checkpoint, "state.tmp.npz")
+    numpy.savez(tmp, C=C, S=S, active=active, iteration=iteration,
+                converged=converged, residuals=json.dumps(residuals),
+                fingerprint=str(fingerprint))
+    os.replace(tmp, path)
+
+    # Matrices of the previous iteration are no longer needed
+    for name in ("l", "d"):
+        old = os.path.join(checkpoint, "%s-%d.npy" % (name, iteration - 1))
+        if os.path.exists(old):
+            os.remove(old)
+
+
+def load_checkpoint(checkpoint):
+    """This function loads the state of the clustering saved by \
+    save_checkpoint.
+    :param checkpoint: Checkpoint directory.
+    :type checkpoint: string
+    :returns state: C, S, l, d (memory-mapped, restored from the copies \
+    of the last completed iteration), active, number of completed \
+    iterations, residuals, whether the iterations stopped early and the \
+    fingerprint of the run, or None if no iteration was completed.
+    """
+    import json
+    import os
+    from numpy.lib.format import open_memmap
+
+    path = os.path.join(checkpoint, "state.npz")
+    if not os.path.exists(path):
+        return None
+
+    with numpy.load(path) as state:
+        C = state["C"]
+        S = int(state["S"])
+        active = state["active"]
+        iteration = int(state["iteration"])
+        converged = bool(state["converged"])
+        residuals = json.loads(str(state["residuals"]))
+        fingerprint = None
+        if "fingerprint" in state.files:
+            fingerprint = str(state["fingerprint"])
+
+    # The matrices may hold part of an interrupted iteration
+    arrays = []
+    for name in ("l", "d"):
+        saved = numpy.load(os.path.join(checkpoint, "%s-%d.npy" %
+                                        (name, iteration)), mmap_mode="r")
+        mapped = open_memmap(os.path.join(checkpoint, name + ".npy"),
+                             mode="w+", dtype=saved.dtype, shape=saved.shape)
+        mapped[:] = saved
+        arrays.append(mapped)
+    l, d = arrays
+
+    return C, S, l, d, active, iteration, residuals, converged, fingerprint
+
+
+def cluster_residuals(C, C_new, bands):
+    """This function measures how much the cluster centres changed \
+    between two iterations.
+    :param C: ND-array containing cluster centres information.
+    :type C: numpy.ndarray
+    :param C_new: ND-array containing updated cluster centres information.
+    :type C_new: numpy.ndarray
+    :param bands: Number of bands (lenght of time series).
+    :type bands: int
+    :returns residual: Dict with the mean displacement of the centres in \
+    pixels (shift), the mean RMS change of the centre series (series) and \
+    which clusters changed at all (moved).
+    """
+    same = (C == C_new) | (numpy.isnan(C) & numpy.isnan(C_new))
+    moved = ~same[:, :bands+2].all(axis=1)
+
+    diff = C_new[:, :bands+2] - C[:, :bands+2]
+    shift = numpy.hypot(diff[:, bands], diff[:, bands+1])
+    series = numpy.sqrt(numpy.mean(diff[:, :bands]**2, axis=1))
+
+    # Clusters without pixels have no centre
+    valid = ~numpy.isnan(shift)
+    return {"shift": float(shift[valid].mean()) if valid.any() else 0.0,
+            "series": float(series[valid].mean()) if valid.any() else 0.0,
+            "moved": moved}
+
+
+def check_dtype(dtype):
+    """This function checks the float type of the image, float64 or \
+    float32, the only types of the kernels.
+    :param dtype: Float type.
+    :type dtype: string or numpy.dtype
+    """
+    try:
+        valid = numpy.dtype(dtype) in (numpy.float64, numpy.float32)
+    except TypeError:
+        valid = False
+    if not valid:
+        raise ValueError("Unknown dtype %s, use float64 or float32." % dtype)
+
+
+def new_stats():
+    """This function creates the stats of a run, filled by snitc and \
+    cluster.
+    :returns stats: Dict with the wall time (seconds), number of calls \
+    (calls) and pixels processed (pixels) of each stage (stages), the \
+    number of warping distances computed and pruned (distances) and the \
+    residuals of each iteration (iterations).
+    """
+    return {"stages": {}, "distances": {"evaluated": 0, "pruned": 0},
+            "iterations": []}
+
+
+def record(stats, stage, seconds, pixels, callback=None, **info):
+    """This function adds a run of a stage to the stats, logs it and \
+    passes it to the callback.
+    :param stats: Stats, updated in place.
+    :type stats: dict
+    :param stage: Name of the stage.
+    :type stage: string
+    :param seconds: Wall time of the stage.
+    :type seconds: float
+    :param pixels: Pixels processed by the stage.
+    :type pixels: int
+    :param callback: Function called as callback(stage, info).
+    :type callback: function
+    :param info: Other information of the stage, passed to the callback.
+    """
+    total = stats["stages"].setdefault(stage, {"seconds": 0.0, "calls": 0,
+                                               "pixels": 0})
+    total["seconds"] += seconds
+    total["calls"] += 1
+    total["pixels"] += pixels
+
+    logger.debug("%s: %.3f s, %d pixels", stage, seconds, pixels)
+    if callback is not None:
+        callback(stage, dict(info, seconds=seconds, pixels=pixels))
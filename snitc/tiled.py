@@ -0,0 +1,315 @@
+"""Out-of-core SNITC of rasters larger than memory."""
+import time
+import numpy
+
+from .connectivity import postprocessing
+from .grid import grid_centres, grid_hex, grid_regular
+from .segmentation import (check_dtype, checkpoint_stage, cluster,
+                           georeference, new_stats, normalize, pixel_major,
+                           read_pixels, record)
+
+
+def snitc_tiled(dataset, dst_path, ki, m, distance_calculation,
+                weight_twdtw, nodata=0, scale=10000, iter=10,
+                pattern="hexagonal", tile_size=2048, halo=None,
+                dtype="float64", mask=None, **kwargs):
+    """This function creates spatial-temporal superpixels of a SITS larger \
+    than memory, reading blocks with rasterio windows or from a (dask) \
+    xarray.DataArray. Each tile is segmented with a halo around it, and \
+    segments split by the seam of two tiles are merged when both tiles \
+    agree on most of the halo. Peak memory depends on the tile size, not \
+    on the scene size. The tiles of a dask-backed DataArray are read and \
+    segmented as dask tasks, a row of tiles at a time, on the current \
+    scheduler (for example a local distributed cluster), and give the same \
+    result.
+    :param dataset: SITS dataset, a xarray.DataArray can have the \
+    dimensions (time, variable, y, x), see snitc.
+    :type dataset: Rasterio dataset object or a xarray.DataArray.
+    :param dst_path: Path of the GeoTIFF label raster to be written.
+    :type dst_path: string
+    :param ki: Number or desired superpixels in the whole scene.
+    :type ki: int
+    :param m: Compactness value.
+    :type m: int
+    :param tile_size: Size in pixels of the tiles, without halo.
+    :type tile_size: int
+    :param halo: Size in pixels of the halo around each tile, at least 2S \
+    so that clusters near a seam see the same pixels in both tiles. \
+    Default is 2S+1.
+    :type halo: int
+    :param dtype: Precision of the tiles, float64 (default) or float32.
+    :type dtype: string
+    :param mask: If nodata, pixels whose time series is entirely nodata \
+    are not clustered and are written as -1, the nodata of the output.
+    :type mask: string
+    :param kwargs: Other parameters of snitc (window, pruning, engine...) \
+    and the stats and callback of cluster, shared by all tiles. Dask tasks \
+    fill their own stats, that are added to stats, and the callback is \
+    called with the tile stage after each tile instead. Each tile keeps \
+    its checkpoint in a subdirectory (tile-<row>-<column>).
+    :returns dst_path: Path of the segmentation raster.
+    """
+    import rasterio
+    from rasterio.transform import Affine
+    from rasterio.windows import Window
+
+    check_dtype(dtype)
+
+    tasks = False
+    if isinstance(dataset, rasterio.io.DatasetReader):
+        rows = dataset.height
+        columns = dataset.width
+        profile = dataset.profile.copy()
+    else:
+        rows, columns = dataset.shape[-2:]
+        if dataset.ndim == 4:
+            # Multivariate SITS (time, variable, y, x)
+            kwargs["variables"] = dataset.shape[1]
+        transform, crs = georeference(dataset)
+        profile = {"height": rows, "width": columns, "crs": crs,
+                   "transform": Affine(*tuple(transform)[:6])}
+        tasks = dataset.chunks is not None
+        if kwargs.get("dates") is None:
+            times = dataset.coords[dataset.dims[0]].values
+            if numpy.issubdtype(times.dtype, numpy.datetime64):
+                kwargs["dates"] = times
+
+    # Cluster centres of the whole scene, shared by overlapping tiles
+    if pattern == "regular":
+        positions, S = grid_regular(rows, columns, ki)
+    else:
+        positions, S = grid_hex(rows, columns, ki)
+    if halo is None:
+        halo = 2*S + 1
+    if tile_size <= S:
+        raise ValueError("tile_size must be larger than the spacing "
+                         "between superpixels.")
+    if halo < 2*S:
+        raise ValueError("halo must be at least twice the spacing "
+                         "between superpixels.")
+
+    profile.update(driver="GTiff", count=1, dtype="int32",
+                   nodata=-1 if mask == "nodata" else None,
+                   BIGTIFF="IF_SAFER")
+
+    # Dask tasks do not share the stats and callback of this process
+    stats = kwargs.pop("stats", None) if tasks else None
+    callback = kwargs.pop("callback", None) if tasks else None
+    if tasks:
+        import dask
+        if stats is None:
+            stats = new_stats()
+
+    # Union-find of the labels of all tiles
+    parent = []
+    offset = 0
+    # Labels written to the cores, labels only seen in a halo are dropped
+    written = []
+
+    with rasterio.open(dst_path, "w+", **profile) as dst:
+        for r0 in range(0, rows, tile_size):
+            r1 = min(r0 + tile_size, rows)
+
+            # Tiles of the row, with halo
+            tiles = []
+            for c0 in range(0, columns, tile_size):
+                c1 = min(c0 + tile_size, columns)
+                tiles.append((c0, c1, max(r0 - halo, 0),
+                              min(r1 + halo, rows), max(c0 - halo, 0),
+                              min(c1 + halo, columns)))
+
+            segmented = []
+            for c0, c1, hr0, hr1, hc0, hc1 in tiles:
+                # Centres inside the tile with halo
+                inside = ((positions[:, 0] >= hr0) &
+                          (positions[:, 0] < hr1) &
+                          (positions[:, 1] >= hc0) &
+                          (positions[:, 1] < hc1))
+                centres = positions[inside] - [hr0, hc0]
+                params = checkpoint_stage(kwargs, "tile-%d-%d" % (r0, c0))
+
+                if tasks:
+                    img = dask.delayed(pixel_major)(
+                        dataset.data[..., hr0:hr1, hc0:hc1], dtype)
+                    segmented.append(dask.delayed(segment_tile)(
+                        img, centres, S, m, distance_calculation,
+                        weight_twdtw, nodata, scale, iter, mask,
+                        dict(params, stats=new_stats())))
+                    continue
+
+                # READ TILE
+                if isinstance(dataset, rasterio.io.DatasetReader):
+                    img = read_pixels(dataset, Window(hc0, hr0, hc1 - hc0,
+                                                      hr1 - hr0),
+                                      dtype=dtype,
+                                      variables=kwargs.get("variables", 1))
+                else:
+                    # Only the tile is loaded from a lazy DataArray
+                    img = pixel_major(dataset[..., hr0:hr1, hc0:hc1].values,
+                                      dtype=dtype)
+                segmented.append(segment_tile(img, centres, S, m,
+                                              distance_calculation,
+                                              weight_twdtw, nodata, scale,
+                                              iter, mask, params))
+                img = None
+            if tasks:
+                segmented = dask.compute(*segmented)
+
+            for (c0, c1, hr0, hr1, hc0, hc1), labelled in zip(tiles,
+                                                              segmented):
+                if tasks:
+                    labelled, tile_stats, seconds = labelled
+                    merge_stats(stats, tile_stats)
+                    record(stats, "tile", seconds, labelled.size, callback,
+                           row=r0, column=c0)
+                else:
+                    labelled = labelled[0]
+
+                # Give global labels to the tile, masked pixels keep -1
+                labelled = labelled.astype(numpy.int64)
+                segments = labelled >= 0
+                uniq, inverse = numpy.unique(labelled[segments],
+                                             return_inverse=True)
+                labelled[segments] = inverse.ravel() + offset
+                parent.extend(range(offset, offset + len(uniq)))
+                offset = offset + len(uniq)
+
+                # Halo already written by previous tiles (rows above and
+                # columns on the left)
+                prev = dst.read(1, window=Window(hc0, hr0, hc1 - hc0,
+                                                 r1 - hr0))
+                done = numpy.zeros(prev.shape, dtype=bool)
+                done[:r0 - hr0, :] = True
+                done[:, :c0 - hc0] = True
+                if done.any():
+                    merge_seams(parent, labelled[:r1 - hr0][done],
+                                prev[done])
+
+                # Write the core of the tile
+                core = labelled[r0 - hr0:r1 - hr0, c0 - hc0:c1 - hc0]
+                dst.write(core.astype(numpy.int32), 1,
+                          window=Window(c0, r0, c1 - c0, r1 - r0))
+                written.append(numpy.unique(core[core >= 0]))
+
+        # Relabel merged segments with consecutive labels
+        roots = numpy.array([find_root(parent, i) for i in range(offset)],
+                            dtype=numpy.int64)
+        uniq = numpy.unique(roots[numpy.concatenate(written + [
+            numpy.empty(0, dtype=numpy.int64)])])
+        lookup = numpy.searchsorted(uniq, roots).astype(numpy.int32)
+        for r0 in range(0, rows, tile_size):
+            for c0 in range(0, columns, tile_size):
+                win = Window(c0, r0, min(tile_size, columns - c0),
+                             min(tile_size, rows - r0))
+                block = dst.read(1, window=win)
+                segments = block >= 0
+                block[segments] = lookup[block[segments]]
+                dst.write(block, 1, window=win)
+
+    return dst_path
+
+
+def segment_tile(img, positions, S, m, distance_calculation, weight_twdtw,
+                 nodata, scale, iter, mask, kwargs):
+    """This function segments a tile with halo, seeded with the centres of \
+    the whole scene inside it. The other parameters are the same of \
+    snitc_tiled.
+    :param img: Tile with shape (rows, columns, bands) and nodata as NaN, \
+    normalized in place.
+    :type img: numpy.ndarray
+    :param positions: Row and column of the centres in the tile.
+    :type positions: numpy.ndarray
+    :param S: Spacing between superpixels of the scene.
+    :type S: int
+    :param kwargs: Other parameters of cluster.
+    :type kwargs: dict
+    :returns labelled: Segmentation of the tile with consecutive labels, \
+    and -1 for masked pixels.
+    :returns stats: Stats of cluster, if given in kwargs.
+    :returns seconds: Wall time of the tile.
+    """
+    start = time.perf_counter()
+    valid = None
+    if mask == "nodata":
+        valid = ~numpy.isnan(img).all(axis=2)
+    img = normalize(img, nodata, scale)
+
+    C = grid_centres(img, positions, img.shape[2])
+    C, S, l, d, k, residuals = cluster(img, C.shape[0], m,
+                                       distance_calculation, weight_twdtw,
+                                       iter=iter, init=(C, S), mask=valid,
+                                       **kwargs)
+    img = None
+
+    # Remove noise, masked pixels get -1
+    labelled = postprocessing(l, S, nodata=-2)
+
+    return labelled, kwargs.get("stats"), time.perf_counter() - start
+
+
+def merge_stats(stats, other):
+    """This function adds the stats of a run to other stats.
+    :param stats: Stats, updated in place. Nothing is done if None.
+    :type stats: dict
+    :param other: Stats to be added, see new_stats.
+    :type other: dict
+    """
+    if stats is None:
+        return
+
+    for stage, total in other["stages"].items():
+        current = stats["stages"].setdefault(stage, {"seconds": 0.0,
+                                                     "calls": 0,
+                                                     "pixels": 0})
+        for key in current:
+            current[key] += total[key]
+    for key in stats["distances"]:
+        stats["distances"][key] += other["distances"][key]
+    stats["iterations"].extend(other["iterations"])
+
+
+def find_root(parent, a):
+    """This function finds the representative label of a merged segment.
+    :param parent: Union-find parent of each label.
+    :type parent: list
+    :param a: Label.
+    :type a: int
+    :returns a: Representative label.
+    """
+    while parent[a] != a:
+        parent[a] = parent[parent[a]]
+        a = parent[a]
+
+    return a
+
+
+def merge_seams(parent, tile, prev):
+    """This function merges the labels of a tile with the labels written \
+    by its neighbours, when each one covers most of the other in the halo.
+    :param parent: Union-find parent of each label, updated in place.
+    :type parent: list
+    :param tile: Labels given by the tile to the halo pixels.
+    :type tile: numpy.ndarray
+    :param prev: Labels given by the neighbours to the same pixels.
+    :type prev: numpy.ndarray
+    """
+    # Masked pixels are not merged
+    segments = (tile >= 0) & (prev >= 0)
+    tile = tile[segments]
+    prev = prev[segments]
+
+    pairs, count = numpy.unique(numpy.stack((tile, prev), axis=1), axis=0,
+                                return_counts=True)
+    tile_labels, tile_count = numpy.unique(tile, return_counts=True)
+    prev_labels, prev_count = numpy.unique(prev, return_counts=True)
+
+    # Pixels of each label in the halo
+    na = tile_count[numpy.searchsorted(tile_labels, pairs[:, 0])]
+    nb = prev_count[numpy.searchsorted(prev_labels, pairs[:, 1])]
+
+    for (a, b), n, n_a, n_b in zip(pairs, count, na, nb):
+        if 2*n > n_a and 2*n > n_b:
+            ra = find_root(parent, int(a))
+            rb = find_root(parent, int(b))
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
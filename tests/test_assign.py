@@ -0,0 +1,61 @@
+import numpy
+import pytest
+
+from snitc.benchmark import synthetic_sits
+from snitc.segmentation import cluster, normalize, pixel_major
+
+OPTIONS = [
+    {},
+    {"window": 3},
+    {"psi": 2},
+    {"penalty": 0.1},
+    {"max_step": 0.2},
+    {"max_dist": 0.5},
+]
+
+
+@pytest.fixture(scope="module")
+def img():
+    dataset, truth = synthetic_sits(40, 40, 10, segments=5)
+    return normalize(pixel_major(dataset.values), 0, 10000)
+
+
+def run(img, distance_calculation, engine, pruning, params):
+    return cluster(img, 16, 5, distance_calculation, "logistic", iter=3,
+                   engine=engine, pruning=pruning, **params)
+
+
+@pytest.mark.parametrize("params", OPTIONS)
+@pytest.mark.parametrize("distance_calculation", ["dtw", "twdtw"])
+@pytest.mark.parametrize("engine", ["serial", "parallel", "pixel"])
+def test_pruning_gives_the_same_labels(img, engine, distance_calculation,
+                                       params):
+    C, S, l = run(img, distance_calculation, engine, False, params)[:3]
+    pruned = run(img, distance_calculation, engine, True, params)
+
+    numpy.testing.assert_array_equal(pruned[2], l)
+    numpy.testing.assert_array_equal(pruned[0], C)
+    if not params:
+        assert sum(residual["pruned"] for residual in pruned[5]) > 0
+
+
+@pytest.mark.parametrize("params", OPTIONS)
+@pytest.mark.parametrize("distance_calculation", ["dtw", "twdtw"])
+def test_parallel_engine_follows_the_serial_order(img, distance_calculation,
+                                                  params):
+    C, S, l = run(img, distance_calculation, "serial", False, params)[:3]
+    parallel = run(img, distance_calculation, "parallel", False, params)
+
+    numpy.testing.assert_array_equal(parallel[2], l)
+    numpy.testing.assert_array_equal(parallel[0], C)
+
+
+@pytest.mark.parametrize("params", OPTIONS)
+@pytest.mark.parametrize("distance_calculation", ["dtw", "twdtw"])
+def test_pixel_engine_follows_the_serial_order(img, distance_calculation,
+                                               params):
+    C, S, l = run(img, distance_calculation, "serial", False, params)[:3]
+    pixel = run(img, distance_calculation, "pixel", False, params)
+
+    numpy.testing.assert_array_equal(pixel[2], l)
+    numpy.testing.assert_array_equal(pixel[0], C)
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from snitc.batch import run_scene
+from snitc.benchmark import synthetic_raster, synthetic_sits
+
+rasterio = pytest.importorskip("rasterio")
+
+
+@pytest.mark.parametrize("checkpoint", [None, True])
+def test_checkpoint_is_opt_in(tmp_path, monkeypatch, checkpoint):
+    import snitc.segmentation
+
+    dataset, truth = synthetic_sits(32, 32, 8, segments=4)
+    memfile = synthetic_raster(dataset)
+    stack = tmp_path / "stack.tif"
+    stack.write_bytes(memfile.read())
+
+    # Checkpoint directories given to snitc
+    given = []
+    arrays = snitc.segmentation.checkpoint_arrays
+
+    def checkpoint_arrays(path, l, d):
+        given.append(path)
+        return arrays(path, l, d)
+
+    monkeypatch.setattr(snitc.segmentation, "checkpoint_arrays",
+                        checkpoint_arrays)
+
+    scene = {"name": "stack", "input": str(stack), "ki": 8, "m": 5,
+             "output": str(tmp_path / "labels.tif")}
+    if checkpoint is not None:
+        scene["checkpoint"] = checkpoint
+    run_scene(scene, str(tmp_path))
+
+    assert os.path.exists(tmp_path / "stack.done.json")
+    if checkpoint is None:
+        assert given == []
+    else:
+        assert given == [os.path.join(str(tmp_path), "stack.checkpoint")]
+        assert not os.path.exists(given[0])
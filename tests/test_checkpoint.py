@@ -0,0 +1,83 @@
+import numpy
+import pytest
+
+from snitc import snitc, snitc_tiled
+from snitc.benchmark import synthetic_sits
+from snitc.pyramid import cluster_paa, cluster_pyramid
+from snitc.segmentation import normalize, pixel_major
+
+
+class Interrupt(Exception):
+    pass
+
+
+def interrupt_at(iteration):
+    def callback(stage, info):
+        # Stop after the assignment, with l and d already changed
+        if stage == "assign" and info.get("iteration") == iteration:
+            raise Interrupt()
+    return callback
+
+
+@pytest.mark.parametrize("tol", [None, 0.001])
+def test_resume_after_interruption(tmp_path, tol):
+    dataset, truth = synthetic_sits(48, 48, 8, segments=4)
+    params = dict(ki=12, m=5, distance_calculation="dtw",
+                  weight_twdtw="linear", iter=8, tol=tol, output="matrix",
+                  return_stats=True)
+
+    expected, stats = snitc(dataset, **params)
+
+    checkpoint = str(tmp_path / "checkpoint")
+    with pytest.raises(Interrupt):
+        snitc(dataset, checkpoint=checkpoint, callback=interrupt_at(3),
+              **params)
+    resumed, resumed_stats = snitc(dataset, checkpoint=checkpoint,
+                                   resume=True, **params)
+
+    numpy.testing.assert_array_equal(resumed, expected)
+    assert ([r["relabelled"] for r in resumed_stats["iterations"]] ==
+            [r["relabelled"] for r in stats["iterations"]])
+
+
+def test_resume_with_other_parameters(tmp_path):
+    dataset, truth = synthetic_sits(32, 32, 8, segments=4)
+    checkpoint = str(tmp_path / "checkpoint")
+    snitc(dataset, 8, 5, "dtw", "linear", iter=2, output="matrix",
+          checkpoint=checkpoint)
+
+    with pytest.raises(ValueError, match="checkpoint"):
+        snitc(dataset, 8, 10, "dtw", "linear", iter=2, output="matrix",
+              checkpoint=checkpoint, resume=True)
+
+
+@pytest.mark.parametrize("func,params", [
+    (cluster_paa, {"factor": 3, "iter": 4}),
+    (cluster_pyramid, {"factor": 2, "iter": 3}),
+])
+def test_stages_keep_their_own_checkpoint(tmp_path, func, params):
+    dataset, truth = synthetic_sits(48, 48, 12, segments=4)
+    img = normalize(pixel_major(dataset.values), 0, 10000)
+
+    C, S, l = func(img, 16, 5, "dtw", "linear", **params)[:3]
+    checkpoint = str(tmp_path / "checkpoint")
+    for i in range(2):
+        resumed = func(img, 16, 5, "dtw", "linear", checkpoint=checkpoint,
+                       resume=True, **params)
+        numpy.testing.assert_array_equal(resumed[0], C)
+        numpy.testing.assert_array_equal(resumed[2], l)
+
+
+def test_tiles_keep_their_own_checkpoint(tmp_path):
+    rasterio = pytest.importorskip("rasterio")
+    dataset, truth = synthetic_sits(128, 128, 8, segments=12)
+
+    snitc_tiled(dataset, str(tmp_path / "tiled.tif"), 64, 5, "dtw",
+                "linear", tile_size=64)
+    snitc_tiled(dataset, str(tmp_path / "checkpoint.tif"), 64, 5, "dtw",
+                "linear", tile_size=64, checkpoint=str(tmp_path / "ck"),
+                resume=True)
+
+    with rasterio.open(tmp_path / "tiled.tif") as expected, \
+            rasterio.open(tmp_path / "checkpoint.tif") as labels:
+        numpy.testing.assert_array_equal(labels.read(1), expected.read(1))
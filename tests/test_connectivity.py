@@ -0,0 +1,45 @@
+import numpy
+
+from snitc.connectivity import postprocessing
+
+
+def test_more_than_65k_segments():
+    # 90000 blocks of 2x2 pixels, each one its own segment
+    blocks = numpy.arange(300*300, dtype=numpy.int32).reshape(300, 300)
+    raster = blocks.repeat(2, axis=0).repeat(2, axis=1)
+
+    final = postprocessing(raster, 2)
+
+    numpy.testing.assert_array_equal(final, raster)
+
+
+def test_components_of_a_segment_are_split():
+    raster = numpy.zeros((20, 20), dtype=numpy.int32)
+    raster[:, 10:] = 1
+    raster[5:15, 13:17] = 0
+
+    final = postprocessing(raster, 2)
+
+    assert numpy.unique(final).size == 3
+    assert final[0, 0] != final[10, 15]
+
+
+def test_small_components_are_merged():
+    raster = numpy.zeros((20, 20), dtype=numpy.int32)
+    raster[:, 10:] = 1
+    raster[3, 3:5] = 2
+
+    final = postprocessing(raster, 4)
+
+    numpy.testing.assert_array_equal(final, numpy.where(raster == 1, 1, 0))
+
+
+def test_masked_pixels():
+    raster = numpy.zeros((20, 20), dtype=numpy.int32)
+    raster[:, 10:] = 1
+    raster[:2, :2] = -2
+
+    final = postprocessing(raster, 4, nodata=-2)
+
+    assert (final[:2, :2] == -1).all()
+    assert numpy.unique(final[final >= 0]).tolist() == [0, 1]
@@ -0,0 +1,89 @@
+import numpy
+import pytest
+
+from snitc.distance import (dtw_options, time_weight, twdtw_distances,
+                            warping_distance)
+
+
+def reference(x, y, cost):
+    # Full warping matrix, the cost of each pair of dates is given
+    n = len(x)
+    D = numpy.full((n + 1, n + 1), numpy.inf)
+    D[0, 0] = 0
+    for i in range(n):
+        for j in range(n):
+            D[i+1, j+1] = cost(i, j) + min(D[i, j], D[i, j+1], D[i+1, j])
+    return D[n, n]
+
+
+def kernel(x, y, weight, opts):
+    buf = numpy.empty((2, len(y)//opts[6] + 1))
+    return warping_distance(x, y, weight, opts, buf)
+
+
+def test_dtw():
+    rng = numpy.random.default_rng(0)
+    opts = dtw_options("dtw")
+    weight = numpy.zeros((12, 12))
+    for i in range(200):
+        x, y = rng.random((2, 12))
+        expected = reference(x, y, lambda i, j: (x[i] - y[j])**2)**0.5
+        assert kernel(x, y, weight, opts) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("weight_twdtw", ["logistic", "linear"])
+def test_twdtw(weight_twdtw):
+    rng = numpy.random.default_rng(1)
+    opts = dtw_options("twdtw")
+    weight = time_weight(numpy.sort(rng.uniform(0, 365, 12)), weight_twdtw)
+    for i in range(200):
+        x, y = rng.random((2, 12))
+        expected = reference(x, y, lambda i, j: abs(x[i] - y[j]) +
+                             weight[i, j])
+        assert kernel(x, y, weight, opts) == pytest.approx(expected)
+
+
+def test_dependent_dtw():
+    rng = numpy.random.default_rng(2)
+    opts = dtw_options("dtw", variables=3)
+    weight = numpy.zeros((8, 8))
+    for i in range(200):
+        # Date major series of 8 dates and 3 variables
+        x, y = rng.random((2, 8, 3))
+        expected = reference(x, y, lambda i, j: ((x[i] - y[j])**2).sum())
+        assert kernel(x.ravel(), y.ravel(), weight,
+                      opts) == pytest.approx(expected**0.5)
+
+
+@pytest.mark.parametrize("params", [
+    {"window": 3},
+    {"psi": 2},
+    {"penalty": 0.1},
+    {"max_step": 0.5},
+    {"max_dist": 1.0},
+    {"window": 4, "psi": 1, "penalty": 0.05, "max_step": 0.7},
+])
+def test_dtw_options(params):
+    dtw = pytest.importorskip("dtaidistance.dtw")
+    rng = numpy.random.default_rng(3)
+    opts = dtw_options("dtw", **params)
+    weight = numpy.zeros((12, 12))
+    for i in range(200):
+        x, y = rng.random((2, 12))
+        expected = dtw.distance(x, y, use_c=False, **params)
+        assert kernel(x, y, weight, opts) == pytest.approx(expected)
+
+
+def test_twdtw_distances():
+    rng = numpy.random.default_rng(4)
+    opts = dtw_options("twdtw")
+    weight = time_weight(numpy.linspace(0, 365, 10, endpoint=False),
+                         "logistic")
+    block = rng.random((5, 6, 10))
+    c_series = rng.random(10)
+
+    dc = twdtw_distances(block, c_series, weight, opts)
+
+    for r in range(5):
+        for c in range(6):
+            assert dc[r, c] == kernel(block[r, c], c_series, weight, opts)
@@ -0,0 +1,50 @@
+import numpy
+import pytest
+
+from snitc import write_segments
+
+geopandas = pytest.importorskip("geopandas")
+
+
+@pytest.mark.parametrize("extension", [".gpkg", ".fgb", ".shp"])
+def test_write_segments_in_chunks(tmp_path, extension):
+    segmentation = (numpy.arange(40)[:, None]//5*8 +
+                    numpy.arange(40)[None, :]//5).astype(numpy.int32)
+    segmentation[:5, :5] = -1
+    path = str(tmp_path / ("segments" + extension))
+
+    write_segments(segmentation, path, (1, 0, 0, 0, -1, 40), "EPSG:32723",
+                   chunk=5)
+
+    segments = geopandas.read_file(path)
+    assert sorted(segments["label"]) == list(range(1, 64))
+
+
+def test_fgb_with_multipolygons(tmp_path):
+    # Segment 1 has two parts, and it is not in the first chunk
+    segmentation = numpy.zeros((20, 20), dtype=numpy.int32)
+    segmentation[:, 10:] = 1
+    segmentation[5:10, :5] = 1
+    segmentation[12:, 12:] = 2
+    path = str(tmp_path / "segments.fgb")
+
+    write_segments(segmentation, path, (1, 0, 0, 0, -1, 20), "EPSG:32723",
+                   chunk=1)
+
+    segments = geopandas.read_file(path).sort_values("label")
+    assert list(segments["label"]) == [0, 1, 2]
+    assert segments["geometry"].area.sum() == 400
+    assert not (tmp_path / "segments.fgb.tmp.gpkg").exists()
+
+
+def test_write_pandas_keeps_large_labels():
+    pytest.importorskip("rasterio")
+    from snitc.export import write_pandas
+
+    # Above 2**24, float32 would merge consecutive labels
+    segmentation = numpy.full((4, 4), 2**24, dtype=numpy.int64)
+    segmentation[:, 2:] += 1
+
+    gdf = write_pandas(segmentation, (1, 0, 0, 0, -1, 4), "EPSG:32723")
+
+    assert len(gdf) == 2
@@ -0,0 +1,51 @@
+import numpy
+import pytest
+
+from snitc.merge import merge_segments
+
+
+@pytest.fixture
+def quadrants():
+    # Four segments, the top ones and the bottom ones have close series
+    segmentation = numpy.zeros((20, 20), dtype=numpy.int32)
+    segmentation[:10, 10:] = 1
+    segmentation[10:, :10] = 2
+    segmentation[10:, 10:] = 3
+    C = numpy.zeros((4, 6 + 3))
+    C[:, :6] = numpy.array([0.1, 0.12, 0.5, 0.53])[:, None]
+    return segmentation, C
+
+
+def test_threshold(quadrants):
+    segmentation, C = quadrants
+
+    merged = merge_segments(segmentation, segmentation, C, threshold=0.1)
+
+    expected = numpy.where(segmentation < 2, 0, 1)
+    numpy.testing.assert_array_equal(merged, expected)
+
+
+def test_target(quadrants):
+    segmentation, C = quadrants
+
+    merged = merge_segments(segmentation, segmentation, C, segments=3)
+
+    expected = numpy.array([0, 0, 1, 2])[segmentation]
+    numpy.testing.assert_array_equal(merged, expected)
+
+
+def test_masked_pixels(quadrants):
+    segmentation, C = quadrants
+    segmentation[:2, :2] = -1
+
+    merged = merge_segments(segmentation, segmentation, C, segments=1)
+
+    assert (merged[:2, :2] == -1).all()
+    assert (merged[segmentation >= 0] == 0).all()
+
+
+def test_threshold_or_segments(quadrants):
+    segmentation, C = quadrants
+
+    with pytest.raises(ValueError):
+        merge_segments(segmentation, segmentation, C)
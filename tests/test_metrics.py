@@ -0,0 +1,47 @@
+import numpy
+import pytest
+
+from snitc.metrics import segment_metrics
+
+
+def test_metrics():
+    # Four square segments with constant series
+    segmentation = numpy.zeros((20, 20), dtype=numpy.int32)
+    segmentation[:10, 10:] = 1
+    segmentation[10:, :10] = 2
+    segmentation[10:, 10:] = 3
+    series = numpy.array([0.1, 0.12, 0.5, 0.53])
+    C = numpy.zeros((4, 6 + 3))
+    C[:, :6] = series[:, None]
+    img = numpy.repeat(series[segmentation][:, :, None], 6, axis=2)
+    # Half of the last segment is 0.1 away from its series
+    img[15:, 10:] += 0.1
+
+    values = segment_metrics(segmentation, img, segmentation, C)
+
+    numpy.testing.assert_array_equal(values["size"], [100]*4)
+    numpy.testing.assert_allclose(values["compactness"], [numpy.pi/4]*4)
+    numpy.testing.assert_allclose(values["heterogeneity"],
+                                  [0, 0, 0, 6**0.5*0.1/2], atol=1e-12)
+    # DTW between constant series, both neighbours share 10 pixel borders
+    dist = 6**0.5*abs(series[:, None] - series[None, :])
+    numpy.testing.assert_allclose(values["contrast"],
+                                  [(dist[0, 1] + dist[0, 2])/2,
+                                   (dist[1, 0] + dist[1, 3])/2,
+                                   (dist[2, 0] + dist[2, 3])/2,
+                                   (dist[3, 1] + dist[3, 2])/2])
+
+
+def test_only_asked_metrics():
+    segmentation = numpy.zeros((4, 4), dtype=numpy.int32)
+
+    values = segment_metrics(segmentation, metrics=("size",))
+
+    assert list(values) == ["size"]
+
+
+def test_unknown_metric():
+    segmentation = numpy.zeros((4, 4), dtype=numpy.int32)
+
+    with pytest.raises(ValueError, match="Unknown metrics"):
+        segment_metrics(segmentation, metrics=("size", "roundness"))
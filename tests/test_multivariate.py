@@ -0,0 +1,38 @@
+import numpy
+import pytest
+import xarray
+
+from snitc import snitc
+from snitc.benchmark import synthetic_sits
+
+rasterio = pytest.importorskip("rasterio")
+
+
+@pytest.mark.parametrize("distance_calculation", ["dtw", "twdtw"])
+def test_rasterio_and_xarray(tmp_path, distance_calculation):
+    first, truth = synthetic_sits(32, 32, 8, segments=4, seed=0)
+    second, truth = synthetic_sits(32, 32, 8, segments=4, seed=1)
+    dates = first.coords["time"].values
+    # Two variables with their own scale
+    values = numpy.stack([first.values, second.values/10], axis=1)
+    dataset = xarray.DataArray(values, dims=("time", "variable", "y", "x"),
+                               coords={"time": dates})
+    dataset.attrs = first.attrs
+
+    # The time series of each variable one after another
+    path = tmp_path / "stack.tif"
+    with rasterio.open(path, "w", driver="GTiff", count=16, height=32,
+                       width=32, dtype="float64",
+                       transform=first.attrs["transform"],
+                       crs=first.attrs["crs"]) as dst:
+        dst.write(values.transpose(1, 0, 2, 3).reshape(16, 32, 32))
+
+    params = dict(ki=8, m=5, distance_calculation=distance_calculation,
+                  weight_twdtw="logistic", iter=3, scale=[10000, 1000],
+                  dates=dates, output="matrix")
+    expected = snitc(dataset, **params)
+    with rasterio.open(path) as stack:
+        labels = snitc(stack, variables=2, **params)
+
+    numpy.testing.assert_array_equal(labels, expected)
+    assert numpy.unique(expected).size > 1
@@ -0,0 +1,22 @@
+import numpy
+import pytest
+
+from snitc.benchmark import synthetic_sits
+from snitc.pyramid import cluster_paa, cluster_pyramid
+from snitc.segmentation import normalize, pixel_major
+
+
+@pytest.mark.parametrize("func", [cluster_pyramid, cluster_paa])
+def test_mask(func):
+    dataset, truth = synthetic_sits(96, 96, 8, segments=4)
+    img = normalize(pixel_major(dataset.values), 0, 10000)
+    mask = numpy.ones((96, 96), dtype=bool)
+    mask[:40, :30] = False
+    mask[70:] = False
+
+    C, S, l, d, k, residuals = func(img, 30, 5, "dtw", "linear", factor=2,
+                                    mask=mask)
+
+    assert (l[~mask] == -2).all()
+    assert (l[mask] >= 0).all()
+    assert numpy.isneginf(d[~mask]).all()
@@ -0,0 +1,77 @@
+import sys
+
+import numpy
+import pytest
+
+from snitc import snitc
+from snitc.benchmark import synthetic_sits
+from snitc.segmentation import cluster, normalize, pixel_major
+
+
+def test_serial_engine_skips_masked_pixels():
+    dataset, truth = synthetic_sits(48, 48, 8, segments=4)
+    mask = numpy.ones((48, 48), dtype=bool)
+    mask[:20, :10] = False
+    mask[30:, 30:] = False
+
+    results = {}
+    for engine in ("parallel", "serial"):
+        results[engine] = snitc(dataset, 12, 5, "dtw", "linear", iter=3,
+                                engine=engine, mask=mask, output="matrix",
+                                return_stats=True)
+
+    labels, stats = results["serial"]
+    numpy.testing.assert_array_equal(labels, results["parallel"][0])
+    assert stats["distances"] == results["parallel"][1]["distances"]
+
+
+def test_unknown_engine():
+    dataset, truth = synthetic_sits(16, 16, 8, segments=2)
+
+    with pytest.raises(ValueError, match="engine"):
+        snitc(dataset, 4, 5, "dtw", "linear", engine="gpu", output="matrix")
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int32", "double precision"])
+def test_unknown_dtype(dtype):
+    dataset, truth = synthetic_sits(16, 16, 8, segments=2)
+
+    with pytest.raises(ValueError, match="dtype"):
+        snitc(dataset, 4, 5, "dtw", "linear", dtype=dtype, output="matrix")
+
+
+def test_masked_centres_move_to_valid_pixels():
+    dataset, truth = synthetic_sits(96, 96, 8, segments=4)
+    img = normalize(pixel_major(dataset.values), 0, 10000)
+    rows, columns = numpy.indices((96, 96))
+    mask = abs(rows - columns - 10) < 3
+
+    C, S, l, d, k, residuals = cluster(img, 16, 5, "dtw", "linear", iter=3,
+                                       mask=mask)
+
+    # Every centre of the grid falls on a masked pixel
+    assert k > 1
+    assert (l[~mask] == -2).all()
+    assert (l[mask] >= 0).all()
+
+
+def test_mask_without_centres():
+    dataset, truth = synthetic_sits(32, 32, 8, segments=2)
+    mask = numpy.zeros((32, 32), dtype=bool)
+    mask[0, 0] = True
+
+    with pytest.raises(ValueError, match="centre"):
+        snitc(dataset, 1, 5, "dtw", "linear", mask=mask, output="matrix")
+
+
+def test_serial_engine_without_dtaidistance(monkeypatch):
+    dataset, truth = synthetic_sits(32, 32, 8, segments=4)
+    expected = snitc(dataset, 8, 5, "dtw", "linear", iter=3,
+                     engine="serial", output="matrix")
+
+    # The import of a module set to None raises ImportError
+    monkeypatch.setitem(sys.modules, "dtaidistance", None)
+    labels = snitc(dataset, 8, 5, "dtw", "linear", iter=3, engine="serial",
+                   output="matrix")
+
+    numpy.testing.assert_array_equal(labels, expected)
@@ -0,0 +1,46 @@
+import numpy
+import pytest
+
+from snitc import snitc_tiled
+from snitc.benchmark import synthetic_sits
+
+rasterio = pytest.importorskip("rasterio")
+
+
+def read_labels(path):
+    with rasterio.open(path) as dataset:
+        return dataset.read(1)
+
+
+def test_dask_dataarray_without_stats(tmp_path):
+    dask = pytest.importorskip("dask")
+    dataset, truth = synthetic_sits(64, 64, 8, segments=6)
+
+    snitc_tiled(dataset, str(tmp_path / "memory.tif"), 16, 5, "dtw",
+                "linear", tile_size=32)
+    with dask.config.set(scheduler="synchronous"):
+        snitc_tiled(dataset.chunk({"y": 32, "x": 32}),
+                    str(tmp_path / "dask.tif"), 16, 5, "dtw", "linear",
+                    tile_size=32)
+
+    numpy.testing.assert_array_equal(read_labels(tmp_path / "memory.tif"),
+                                     read_labels(tmp_path / "dask.tif"))
+
+
+def test_consecutive_labels(tmp_path):
+    dataset, truth = synthetic_sits(64, 64, 8, segments=6)
+
+    snitc_tiled(dataset, str(tmp_path / "tiled.tif"), 16, 5, "dtw",
+                "linear", tile_size=32)
+
+    labels = read_labels(tmp_path / "tiled.tif")
+    uniq = numpy.unique(labels[labels >= 0])
+    numpy.testing.assert_array_equal(uniq, numpy.arange(uniq.size))
+
+
+def test_halo_smaller_than_2s(tmp_path):
+    dataset, truth = synthetic_sits(64, 64, 8, segments=6)
+
+    with pytest.raises(ValueError, match="halo"):
+        snitc_tiled(dataset, str(tmp_path / "tiled.tif"), 16, 5, "dtw",
+                    "linear", tile_size=32, halo=4)